@@ -0,0 +1,179 @@
+"""
+A per process cache for the data ranking matrices need to answer queries,
+so that repeated queries against the same ranking do not load matrices from
+disk or recompute document norms every time.
+"""
+
+import collections
+import os
+import sys
+
+import numpy
+import scipy.sparse
+
+from condor.config import RANKING_CACHE_SIZE
+
+
+def python_nbytes(items):
+    """
+    Approximate memory held by a container of python strings, containers
+    that know their size, like term lists, tell it.
+    """
+    if hasattr(items, 'nbytes'):
+        return items.nbytes
+    return sys.getsizeof(items) + sum(sys.getsizeof(item) for item in items)
+
+
+def array_nbytes(array):
+    """
+    Memory held by an array, memory mapped arrays live in the OS page cache
+    so they do not count.
+    """
+    if array is None or isinstance(array, numpy.memmap):
+        return 0
+    return array.nbytes
+
+
+class CachedRanking(object):
+    """
+    Everything a ranking matrix needs to score a query.
+
+    The cosine between a document and a query frequency vector `freq` is
+    computed from `vectors . (projection . freq)`, the projection is `None`
+    when documents and queries already live in the same space.
+    """
+
+    def __init__(self, vectors, term_index, projection=None,
+                 document_eids=None, mtime=None):
+        self.vectors = vectors
+        self.projection = projection
+        self.norms = numpy.linalg.norm(vectors, axis=1)
+        self.term_index = term_index
+        self.document_eids = document_eids or []
+        self.mtime = mtime
+        self.nbytes = self._nbytes()
+
+    def _nbytes(self):
+        """
+        Approximate memory held by this entry.
+        """
+        arrays = (self.vectors, self.projection, self.norms)
+        return (
+            python_nbytes(self.term_index) +
+            python_nbytes(self.document_eids) +
+            sum(array_nbytes(array) for array in arrays)
+        )
+
+    def cosines(self, freq):
+        """
+        Computes the cosine between every document and a frequency vector.
+
+        :param freq: dense frequency vector of the query
+        :return: array of cosines, one per document
+        """
+        return self.cosines_many(freq[numpy.newaxis, :])[:, 0]
+
+    def cosines_many(self, freqs):
+        """
+        Computes the cosine between every document and many queries at once.
+
+        Only the columns of the terms present in some query are read.
+
+        :param freqs: dense or sparse queries by terms frequency matrix
+        :return: documents by queries array of cosines
+        """
+        freqs = scipy.sparse.csr_matrix(freqs)
+        columns = numpy.unique(freqs.indices)
+        reduced = freqs[:, columns].toarray().T
+        if self.projection is not None:
+            dot = numpy.dot(
+                self.vectors, numpy.dot(self.projection[:, columns], reduced)
+            )
+        else:
+            dot = numpy.dot(self.vectors[:, columns], reduced)
+        norm_freqs = numpy.linalg.norm(reduced, axis=0)
+        return dot / numpy.outer(self.norms, norm_freqs)
+
+
+class CachedIndex(object):
+    """
+    Everything an inverted index ranking needs to score a query.
+    """
+
+    def __init__(self, index, term_index, document_eids=None, mtime=None):
+        self.index = index
+        self.term_index = term_index
+        self.document_eids = document_eids or []
+        self.mtime = mtime
+        self.nbytes = (
+            index.nbytes +
+            python_nbytes(self.term_index) +
+            python_nbytes(self.document_eids)
+        )
+
+
+class RankingCache(object):
+    """
+    Least recently used cache of `CachedRanking` or `CachedIndex` entries
+    by ranking eid.
+
+    Entries are rebuilt when the ranking or term list files change on disk
+    and the least recently used entries are evicted once the cache holds
+    more than `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=RANKING_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def mtime(ranking_matrix):
+        """
+        Modification times of the files backing a ranking matrix.
+        """
+        return (
+            os.path.getmtime(ranking_matrix.ranking_matrix_path),
+            os.path.getmtime(ranking_matrix.term_document_matrix.term_list_path),
+        )
+
+    @property
+    def nbytes(self):
+        """
+        Approximate memory held by the cache.
+        """
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def get(self, ranking_matrix):
+        """
+        Gets the cached data for a ranking matrix, loading it if needed.
+
+        :param ranking_matrix: ranking matrix to look for
+        :return: the cached entry for the ranking matrix
+        """
+        mtime = self.mtime(ranking_matrix)
+        entry = self._entries.get(ranking_matrix.eid)
+        if entry is not None and entry.mtime == mtime:
+            self.hits += 1
+            self._entries.move_to_end(ranking_matrix.eid)
+            return entry
+        self.misses += 1
+        entry = ranking_matrix.load_cached_ranking()
+        entry.mtime = mtime
+        self._entries[ranking_matrix.eid] = entry
+        self._evict()
+        return entry
+
+    def clear(self):
+        """
+        Drops every entry in the cache.
+        """
+        self._entries.clear()
+
+    def _evict(self):
+        while len(self._entries) > 1 and self.nbytes > self.max_bytes:
+            self._entries.popitem(last=False)
+
+
+ranking_cache = RankingCache()
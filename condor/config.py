@@ -8,6 +8,17 @@ MATRIX_PATH = os.path.join(CONDOR_PATH, 'matrices')
 MODEL_PATH = os.path.join(CONDOR_PATH, 'models')
 DEFAULT_DB_PATH = CONDOR_PATH
 
+# Memory budget, in bytes, of the per process ranking cache.
+RANKING_CACHE_SIZE = int(
+    os.environ.get('CONDOR_RANKING_CACHE_SIZE', 512 * 1024 ** 2)
+)
+
+# Load whole matrices in memory instead of memory mapping them.
+PIN_MATRICES = os.environ.get('CONDOR_PIN_MATRICES', '') not in ('', '0')
+
+# Number of stems cached per language by the stemmers.
+STEM_CACHE_SIZE = int(os.environ.get('CONDOR_STEM_CACHE_SIZE', 2 ** 16))
+
 ALL_CONDOR_PATHS = [
     CONDOR_PATH,
     FULL_TEXT_PATH,
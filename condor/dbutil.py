@@ -6,11 +6,12 @@ manager.
 '''
 
 import click
+import contextlib
 import functools
 import sys
 import os
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import (
     scoped_session,
     sessionmaker,
@@ -19,6 +20,7 @@ from sqlalchemy.orm import (
 from sqlalchemy.exc import OperationalError
 
 from condor.config import DEFAULT_DB_PATH
+from condor.normalize import get_normalizer
 
 
 def engine():
@@ -79,6 +81,35 @@ def requires_db(func):
     return wrapper
 
 
+@contextlib.contextmanager
+def bulk_load(db):
+    """
+    Gets the connection of a session tuned for a bulk load.
+
+    On SQLite the connection gets a bigger page cache and keeps temporary
+    tables in memory, the previous settings are restored afterwards. Disk
+    syncs can not be tuned inside a transaction, the load runs in the single
+    transaction of the session instead. Other databases get the connection
+    as it is.
+
+    :param db: db session in the middle of a transaction
+    :return: a context manager over the connection
+    """
+    connection = db.connection()
+    if connection.dialect.name != 'sqlite':
+        yield connection
+        return
+    cache_size = connection.execute(text('PRAGMA cache_size')).scalar()
+    temp_store = connection.execute(text('PRAGMA temp_store')).scalar()
+    connection.execute(text('PRAGMA cache_size = -65536'))
+    connection.execute(text('PRAGMA temp_store = MEMORY'))
+    try:
+        yield connection
+    finally:
+        connection.execute(text(f'PRAGMA cache_size = {int(cache_size)}'))
+        connection.execute(text(f'PRAGMA temp_store = {int(temp_store)}'))
+
+
 def find_one(db, model, eid):
     """
     Finds exactly one of the given models in the db by eid.
@@ -119,3 +150,21 @@ def one_or_latest(db, model, eid):
             model.created.desc()
         ).first()
     return find_one(db, model, eid)
+
+
+def validate_language(ctx, param, value):
+    """
+    Click callback that checks that queries can be normalized in a language,
+    `auto` and missing languages are left for the rankings to handle.
+
+    :return: the language in lower case
+    """
+    if value is None or value.lower() == 'auto':
+        return value
+    try:
+        get_normalizer(language=value.lower())
+    except (LookupError, OSError, ValueError):
+        raise click.BadParameter(
+            'condor can not normalize {} text'.format(value)
+        )
+    return value.lower()
@@ -0,0 +1,192 @@
+"""
+Extraction of full text from pdf files.
+
+Extracted texts are cached off site by the digest of the pdf contents, so the
+same pdf is only read once no matter how many records point to it, a
+manifest keeps the version of the extractor that produced every text.
+Extraction runs on a pool of worker processes and files that take too long
+are given up on.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import warnings
+
+from condor.config import FULL_TEXT_PATH
+from condor.util import full_text_from_pdf
+
+
+# Bump this whenever `full_text_from_pdf` changes its output, texts cached by
+# older versions are extracted again.
+EXTRACTOR_VERSION = 1
+
+
+def file_digest(path, chunk_size=1024 ** 2):
+    """
+    Computes the sha1 digest of the contents of a file.
+
+    :param path: path of the file
+    :param chunk_size: bytes to read at once
+    :return: the hex digest
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _extract(pdf_path, text_path):
+    """
+    Writes the text of a pdf file, the text shows up in `text_path` only
+    once it is complete.
+    """
+    partial_path = text_path + '.partial'
+    with open(partial_path, 'w') as output:
+        output.write(full_text_from_pdf(pdf_path))
+    os.replace(partial_path, text_path)
+
+
+class FullTextCache(object):
+    """
+    Texts extracted from pdf files, stored by content digest.
+
+    :param directory: where to store the texts and the manifest
+    """
+
+    manifest_name = 'manifest.json'
+
+    def __init__(self, directory=FULL_TEXT_PATH):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, self.manifest_name)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest:
+                self.manifest = json.load(manifest)
+        else:
+            self.manifest = {}
+
+    def text_path(self, digest):
+        """
+        Path of the text of a pdf with the given digest.
+        """
+        return os.path.join(self.directory, digest + '.txt')
+
+    def is_fresh(self, digest):
+        """
+        Whether the text of a digest was extracted by the current extractor.
+        """
+        return (
+            self.manifest.get(digest) == EXTRACTOR_VERSION and
+            os.path.exists(self.text_path(digest))
+        )
+
+    def save_manifest(self):
+        """
+        Stores the manifest next to the texts.
+        """
+        partial_path = self.manifest_path + '.partial'
+        with open(partial_path, 'w') as manifest:
+            json.dump(self.manifest, manifest, indent=2, sort_keys=True)
+        os.replace(partial_path, self.manifest_path)
+
+    def extract_many(self, pdf_paths, jobs=1, timeout=None, force=False):
+        """
+        Extracts the text of many pdf files.
+
+        :param pdf_paths: paths of the pdf files
+        :param int jobs: number of worker processes
+        :param float timeout: seconds to wait for a single file
+        :param bool force: extract again files that are already cached
+        :return: dict from pdf path to text path, files that could not be
+            extracted in time are left out
+        """
+        digests = {path: file_digest(path) for path in set(pdf_paths)}
+        pending = {}
+        for path, digest in digests.items():
+            if force or not self.is_fresh(digest):
+                pending.setdefault(digest, path)
+
+        if pending:
+            finished = self._run(pending, jobs, timeout)
+            for digest in finished:
+                self.manifest[digest] = EXTRACTOR_VERSION
+            for digest in set(pending) - set(finished):
+                self.manifest.pop(digest, None)
+            self.save_manifest()
+
+        return {
+            path: self.text_path(digest)
+            for path, digest in digests.items()
+            if self.is_fresh(digest)
+        }
+
+    def _run(self, pending, jobs, timeout):
+        """
+        Extracts the pending `{digest: pdf path}` files on a pool of `jobs`
+        worker processes.
+
+        A file is given up on once it is waited for `timeout` seconds, the
+        pool is then terminated to get rid of the stuck worker and the files
+        that were not done yet go to a new pool. Files that fail to be
+        extracted, or take too long, are skipped with a warning.
+
+        :return: set of the digests extracted successfully
+        """
+        finished = set()
+        if jobs <= 1 and timeout is None:
+            for digest, path in pending.items():
+                try:
+                    _extract(path, self.text_path(digest))
+                except Exception as error:
+                    self._give_up(digest, path, error)
+                else:
+                    finished.add(digest)
+            return finished
+
+        queue = list(pending.items())
+        while queue:
+            given_up = None
+            with multiprocessing.Pool(max(jobs, 1)) as pool:
+                results = [
+                    (digest, path, pool.apply_async(
+                        _extract, (path, self.text_path(digest))
+                    ))
+                    for digest, path in queue
+                ]
+                queue = []
+                for position, (digest, path, result) in enumerate(results):
+                    try:
+                        result.get(timeout)
+                    except multiprocessing.TimeoutError:
+                        given_up = (digest, path)
+                        for digest, path, result in results[position + 1:]:
+                            if not result.ready():
+                                queue.append((digest, path))
+                                continue
+                            try:
+                                result.get()
+                            except Exception as error:
+                                self._give_up(digest, path, error)
+                            else:
+                                finished.add(digest)
+                        break
+                    except Exception as error:
+                        self._give_up(digest, path, error)
+                    else:
+                        finished.add(digest)
+            if given_up is not None:
+                self._give_up(*given_up, 'it took longer than {} seconds'
+                              .format(timeout))
+        return finished
+
+    def _give_up(self, digest, path, reason):
+        """
+        Warns about a pdf file that could not be extracted and removes what
+        was written of its text.
+        """
+        warnings.warn('Skipping the full text of {}: {}'.format(path, reason))
+        partial_path = self.text_path(digest) + '.partial'
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
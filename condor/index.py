@@ -0,0 +1,235 @@
+"""
+An inverted index to rank documents with BM25 without scoring every document
+in the collection, postings are stored compressed off site.
+"""
+
+import numpy
+import scipy.sparse
+
+
+class InvertedIndex(object):
+    """
+    Postings lists with term frequencies for every term in a vocabulary.
+
+    The postings of term `t` are the documents
+    `documents[indptr[t]:indptr[t + 1]]`, sorted by document, along with
+    their `frequencies`. The BM25 impact of every posting and the maximum
+    impact of every term are precomputed when the index is created so that
+    queries can skip documents that can not make it to the results, see
+    `search`.
+    """
+
+    def __init__(self, indptr, documents, frequencies, lengths,
+                 k1=1.2, b=0.75):
+        self.indptr = indptr
+        self.documents = documents
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+
+        document_count = len(lengths)
+        document_frequency = numpy.diff(indptr)
+        average_length = numpy.mean(lengths) if document_count else 0.0
+        self.idf = numpy.log(
+            1 + (document_count - document_frequency + 0.5) /
+            (document_frequency + 0.5)
+        )
+        normalized_lengths = self.k1 * (
+            1 - self.b + self.b * lengths[documents] / (average_length or 1)
+        )
+        self.impacts = (
+            numpy.repeat(self.idf, document_frequency) * frequencies *
+            (self.k1 + 1) / (frequencies + normalized_lengths)
+        )
+        self.upper_bounds = numpy.zeros(len(document_frequency))
+        non_empty = document_frequency > 0
+        if numpy.any(non_empty):
+            self.upper_bounds[non_empty] = numpy.maximum.reduceat(
+                self.impacts, indptr[:-1][non_empty]
+            )
+
+    @classmethod
+    def from_counts(cls, counts, k1=1.2, b=0.75):
+        """
+        Creates an index out of a documents by terms matrix of raw counts.
+
+        :param counts: dense or sparse matrix of raw term counts
+        :param float k1: BM25 term frequency saturation
+        :param float b: BM25 document length normalization
+        :return: the inverted index
+        """
+        postings = scipy.sparse.csc_matrix(counts)
+        postings.sort_indices()
+        postings.eliminate_zeros()
+        lengths = numpy.asarray(postings.sum(axis=1)).ravel()
+        return cls(
+            postings.indptr.astype(numpy.int64),
+            postings.indices.astype(numpy.int64),
+            postings.data.astype(numpy.int64),
+            lengths,
+            k1=k1,
+            b=b,
+        )
+
+    def save(self, path):
+        """
+        Stores the index in a compressed numpy file, the documents of every
+        postings list are delta encoded before the compression.
+
+        :param path: path of the `.npz` file
+        """
+        deltas = numpy.diff(self.documents, prepend=0)
+        starts = self.indptr[:-1][numpy.diff(self.indptr) > 0]
+        deltas[starts] = self.documents[starts]
+        numpy.savez_compressed(
+            path,
+            indptr=self.indptr,
+            deltas=deltas.astype(numpy.uint32),
+            frequencies=self.frequencies.astype(
+                numpy.min_scalar_type(self.frequencies.max(initial=0))
+            ),
+            lengths=self.lengths,
+            parameters=numpy.array([self.k1, self.b]),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index stored with `save`.
+
+        :param path: path of the `.npz` file
+        :return: the inverted index
+        """
+        with numpy.load(path) as stored:
+            indptr = stored['indptr']
+            deltas = stored['deltas'].astype(numpy.int64)
+            frequencies = stored['frequencies'].astype(numpy.int64)
+            lengths = stored['lengths']
+            k1, b = stored['parameters']
+        sums = numpy.cumsum(deltas)
+        offsets = numpy.concatenate([[0], sums])[indptr[:-1]]
+        documents = sums - numpy.repeat(offsets, numpy.diff(indptr))
+        return cls(indptr, documents, frequencies, lengths, k1=k1, b=b)
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the index arrays.
+        """
+        return sum(
+            array.nbytes
+            for array in (self.indptr, self.documents, self.frequencies,
+                          self.lengths, self.idf, self.impacts,
+                          self.upper_bounds)
+        )
+
+    def postings(self, term):
+        """
+        Documents and BM25 impacts of a term.
+
+        :param term: column of the term
+        :return: a tuple of arrays `(documents, impacts)`
+        """
+        start, end = self.indptr[term], self.indptr[term + 1]
+        return self.documents[start:end], self.impacts[start:end]
+
+    def search(self, terms, weights=None, limit=None, threshold=None):
+        """
+        Finds the documents with the highest BM25 scores for a query.
+
+        Terms are processed by decreasing maximum impact, following the
+        MaxScore strategy: once the documents not seen so far can not beat
+        the current `limit`-th best score, or the `threshold`, even if they
+        got the maximum impact of every remaining term, the remaining
+        postings are only looked up for the candidates left. Scores are only
+        kept for the documents found in the postings, so the work done does
+        not depend on the size of the collection.
+
+        :param terms: columns of the query terms
+        :param weights: frequency of every term in the query
+        :param limit: number of documents to return
+        :param threshold: return every document scoring above this instead
+        :return: a tuple of arrays `(documents, scores)` sorted by score
+        """
+        terms = numpy.asarray(terms, dtype=numpy.int64)
+        if weights is None:
+            weights = numpy.ones(len(terms))
+        weights = numpy.asarray(weights, dtype=float)
+        if limit is None and threshold is None:
+            limit = 10
+
+        bounds = weights * self.upper_bounds[terms]
+        order = numpy.argsort(-bounds, kind='stable')
+        remaining = numpy.cumsum(bounds[order][::-1])[::-1]
+        remaining = numpy.append(remaining[1:], 0.0)
+
+        documents = numpy.zeros(0, dtype=numpy.int64)
+        scores = numpy.zeros(0)
+        candidates = None
+        for position, term_position in enumerate(order):
+            postings, impacts = self.postings(terms[term_position])
+            impacts = weights[term_position] * impacts
+            if candidates is None:
+                documents, scores = self._accumulate(documents, scores,
+                                                     postings, impacts)
+            elif len(postings) and len(candidates):
+                found = numpy.searchsorted(postings, documents[candidates])
+                found = numpy.minimum(found, len(postings) - 1)
+                matches = postings[found] == documents[candidates]
+                scores[candidates[matches]] += impacts[found[matches]]
+            bar = self._bar(scores, limit, threshold)
+            if bar is None:
+                continue
+            if candidates is None and remaining[position] <= bar:
+                candidates = numpy.arange(len(documents))
+            if candidates is not None:
+                candidates = candidates[
+                    scores[candidates] + remaining[position] > bar
+                ]
+
+        return self._top(documents, scores, limit, threshold)
+
+    @staticmethod
+    def _accumulate(documents, scores, postings, impacts):
+        """
+        Adds the impacts of a postings list to the scores of the documents
+        seen so far.
+
+        :return: a tuple of arrays `(documents, scores)` sorted by document
+        """
+        merged = numpy.union1d(documents, postings)
+        merged_scores = numpy.zeros(len(merged))
+        merged_scores[numpy.searchsorted(merged, documents)] = scores
+        merged_scores[numpy.searchsorted(merged, postings)] += impacts
+        return merged, merged_scores
+
+    @staticmethod
+    def _bar(scores, limit, threshold):
+        """
+        Score a document has to beat to make it into the results, out of
+        the scores of the documents seen so far.
+        """
+        if threshold is not None:
+            return threshold
+        if limit <= 0:
+            return numpy.inf
+        if limit > len(scores):
+            return None
+        bar = numpy.partition(scores, -limit)[-limit]
+        return bar if bar > 0 else None
+
+    @staticmethod
+    def _top(documents, scores, limit, threshold):
+        """
+        Sorted best documents of the final scores.
+        """
+        if threshold is not None:
+            selected = numpy.flatnonzero(scores > threshold)
+        else:
+            selected = numpy.flatnonzero(scores > 0)
+            if limit < len(selected):
+                best = numpy.argpartition(-scores[selected], limit)[:limit]
+                selected = selected[best]
+        selected = selected[numpy.argsort(-scores[selected], kind='stable')]
+        return documents[selected], scores[selected]
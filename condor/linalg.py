@@ -0,0 +1,98 @@
+"""
+Linear algebra helpers to build ranking matrices, they work the same way on
+dense numpy arrays and on scipy sparse matrices.
+"""
+
+import numpy
+import scipy.sparse
+
+
+def frobenius_norm(matrix):
+    """
+    Computes the Frobenius norm of a dense or sparse matrix.
+
+    :param matrix: dense or sparse matrix
+    :return: the norm as a float
+    """
+    if scipy.sparse.issparse(matrix):
+        return numpy.sqrt(numpy.sum(matrix.tocsr().data ** 2))
+    return numpy.linalg.norm(matrix)
+
+
+def covariance_rank(s, covariance, energy=None):
+    """
+    Number of leading singular values that explain less than a fraction of
+    the energy of a matrix, the energy is the sum of its squared singular
+    values, that is its squared Frobenius norm.
+
+    :param s: leading singular values, in decreasing order
+    :param float covariance: fraction of the energy to keep
+    :param float energy: energy of the matrix, the one of `s` if missing
+    :return: the rank to keep
+    """
+    if energy is None:
+        energy = numpy.sum(s ** 2)
+    explained = numpy.cumsum(s ** 2) / energy
+    return int(numpy.sum(explained < covariance))
+
+
+def randomized_svd(matrix, rank, oversamples=10, power_iterations=2,
+                   seed=139):
+    """
+    Computes the leading singular triplets of a matrix using a randomized
+    range finder, see Halko, Martinsson and Tropp (2011).
+
+    The matrix is only touched through matrix products so sparse matrices
+    are never densified.
+
+    :param matrix: dense or sparse matrix to decompose
+    :param int rank: number of singular triplets to compute
+    :param int oversamples: extra samples to improve the range estimation
+    :param int power_iterations: power iterations to sharpen the spectrum
+    :param int seed: seed for the random projection
+    :return: a tuple `(u, s, v)` like the one from `numpy.linalg.svd`
+    """
+    random = numpy.random.RandomState(seed)
+    rows, cols = matrix.shape
+    samples = min(rank + oversamples, rows, cols)
+    projection = random.normal(size=(cols, samples))
+    basis, _ = numpy.linalg.qr(matrix @ projection)
+    for _ in range(power_iterations):
+        basis, _ = numpy.linalg.qr(matrix.T @ basis)
+        basis, _ = numpy.linalg.qr(matrix @ basis)
+    reduced = numpy.asarray((matrix.T @ basis).T)
+    u, s, v = numpy.linalg.svd(reduced, full_matrices=False)
+    u = basis @ u
+    return u[:, :rank], s[:rank], v[:rank, :]
+
+
+def truncated_svd(matrix, rank=None, covariance=None, step=100, **kwargs):
+    """
+    Computes a truncated singular value decomposition of a matrix.
+
+    Either a fixed `rank` is computed or the rank is grown, doubling it from
+    `step`, until the kept singular values explain the `covariance` fraction
+    of the matrix energy, that is the sum of the squared singular values
+    over the squared Frobenius norm of the matrix. This is the only measure
+    that can be computed without the whole spectrum.
+
+    :param matrix: dense or sparse matrix to decompose
+    :param int rank: fixed number of singular triplets to keep
+    :param float covariance: fraction of the energy to keep
+    :param int step: first rank to try when looking for the covariance
+    :param kwargs: extra arguments for `randomized_svd`
+    :return: a tuple `(u, s, v)` with the kept singular triplets
+    """
+    if rank is not None:
+        return randomized_svd(matrix, rank, **kwargs)
+    if covariance is None:
+        raise ValueError('Either a rank or a covariance is required')
+    full_rank = min(matrix.shape)
+    energy = frobenius_norm(matrix) ** 2
+    rank = min(step, full_rank)
+    while True:
+        u, s, v = randomized_svd(matrix, rank, **kwargs)
+        k = covariance_rank(s, covariance, energy)
+        if k < len(s) or rank >= full_rank:
+            return u[:, :k], s[:k], v[:k, :]
+        rank = min(2 * rank, full_rank)
@@ -2,7 +2,9 @@
 Tools for handling a set of documents called bibliography.
 """
 
+import hashlib
 import itertools
+
 from sqlalchemy import (
     Column,
     Unicode,
@@ -10,6 +12,7 @@ from sqlalchemy import (
 
 from sqlalchemy.orm import relationship
 
+from condor.dbutil import bulk_load
 from condor.models.base import AuditableMixing, DeclarativeBase
 from condor.models.document import Document
 
@@ -53,11 +56,31 @@ class Bibliography(AuditableMixing, DeclarativeBase):
             for bib in self.documents
         )))
 
+    @staticmethod
+    def _description(kind, files, description=None, languages=None):
+        """
+        Description of a bibliography created from some files, the given
+        description or a default one, noting the language filter if any.
+        """
+        count = len(files)
+        description = description or f'Document set from {count} {kind} files.'
+        if languages:
+            languages_text = ', '.join(languages)
+            description += f' Filtered to {languages_text}'
+        return description
+
+    @staticmethod
+    def _in_languages(mapping, languages):
+        """
+        Whether a document mapping passes a language filter.
+        """
+        return mapping.get('language', 'english').lower() in languages
+
     @classmethod
     def from_files(cls, kind, files,
                    full_text=None, no_cache=False,
                    description=None, languages=None,
-                   show_progress_bar=False):
+                   show_progress_bar=False, jobs=1, timeout=None):
         """
         Creates a bibliography and attached documents.
 
@@ -67,24 +90,117 @@ class Bibliography(AuditableMixing, DeclarativeBase):
         :param bool no_cache: ignore cache when reading full text
         :param str description: description of the bibliography
         :param list languages: filter to documents of these languages only
+        :param int jobs: number of processes parsing files and extracting
+            full text pdf files
+        :param float timeout: seconds to wait for a single pdf file
         """
-        count = len(files)
-        description = description or f'Document set from {count} {kind} files.'
-        bibliography = Bibliography(description=description)
+        bibliography = Bibliography(
+            description=cls._description(kind, files, description, languages)
+        )
         mappings = Document.mappings_from_files(
             kind,
             files,
             full_text_path=full_text,
             force=no_cache,
             show_progress_bar=show_progress_bar,
+            jobs=jobs,
+            timeout=timeout,
         )
         if languages:
-            languages_text = ', '.join(languages)
-            bibliography.description += f' Filtered to {languages_text}'
             mappings = [
-                m
-                for m in mappings
-                if m.get('language', 'english').lower() in languages
+                m for m in mappings if cls._in_languages(m, languages)
             ]
         bibliography.documents = [Document(**mapping) for mapping in mappings]
         return bibliography
+
+    @classmethod
+    def ingest(cls, database, kind, files,
+               full_text=None, no_cache=False,
+               description=None, languages=None,
+               show_progress_bar=False, jobs=1, timeout=None,
+               batch_size=1000):
+        """
+        Creates a bibliography streaming its documents into the database.
+
+        Documents are written in batches with executemany inserts, on a
+        transaction tuned for bulk loads, so the memory used does not grow
+        with the number of files. Only a digest of the
+        hash and the eid of every document is kept to find duplicates, a
+        duplicate overwrites the document stored before, like in
+        `from_files`.
+
+        :param database: sqlalchemy session to write to
+        :param int batch_size: number of documents to write at once
+        :return: the bibliography, already added to the database
+        """
+        bibliography = Bibliography(
+            description=cls._description(kind, files, description, languages)
+        )
+        database.add(bibliography)
+        database.flush()
+        bibliography.extend(
+            database, kind, files,
+            full_text=full_text,
+            no_cache=no_cache,
+            languages=languages,
+            show_progress_bar=show_progress_bar,
+            jobs=jobs,
+            timeout=timeout,
+            batch_size=batch_size,
+        )
+        return bibliography
+
+    def extend(self, database, kind, files,
+               full_text=None, no_cache=False, languages=None,
+               show_progress_bar=False, jobs=1, timeout=None,
+               batch_size=1000):
+        """
+        Streams the documents of more files into the bibliography, the same
+        way `ingest` does, records already in the bibliography overwrite the
+        stored documents.
+
+        :param database: sqlalchemy session to write to
+        :param int batch_size: number of documents to write at once
+        :return: the number of new documents
+        """
+        seen = {
+            hashlib.sha1(document_hash.encode()).digest(): bytes.fromhex(eid)
+            for eid, document_hash in database.query(
+                Document.eid, Document.hash
+            ).filter(Document.bibliography_eid == self.eid)
+        }
+        added = 0
+        batches = Document.iter_mapping_batches(
+            kind,
+            files,
+            batch_size=batch_size,
+            full_text_path=full_text,
+            force=no_cache,
+            show_progress_bar=show_progress_bar,
+            jobs=jobs,
+            timeout=timeout,
+        )
+        with bulk_load(database) as connection:
+            for mappings in batches:
+                inserts, updates, update_eids, keys = [], [], [], []
+                for mapping in mappings:
+                    if languages and not self._in_languages(mapping,
+                                                            languages):
+                        continue
+                    key = hashlib.sha1(mapping['hash'].encode()).digest()
+                    mapping['bibliography_eid'] = self.eid
+                    if key in seen:
+                        update_eids.append(seen[key].hex())
+                        updates.append(mapping)
+                    else:
+                        keys.append(key)
+                        inserts.append(mapping)
+                eids = Document.insert_many(connection, inserts)
+                added += len(eids)
+                seen.update(
+                    (key, bytes.fromhex(eid)) for key, eid in zip(keys, eids)
+                )
+                Document.update_many(connection, update_eids, updates)
+        database.flush()
+        database.expire(self, ['documents'])
+        return added
@@ -2,18 +2,21 @@
 A tool for managing single documents within a bibliography.
 """
 
+import collections
+import concurrent.futures
 import os
 import glob
+from datetime import datetime
 
-from sqlalchemy import Column, ForeignKey, Unicode
+from sqlalchemy import Column, ForeignKey, Unicode, bindparam
 from sqlalchemy.orm import relationship
 from tqdm import tqdm
 
 from condor.config import FULL_TEXT_PATH
-from condor.models.base import AuditableMixing, DeclarativeBase
-from condor.normalize import LatexAccentRemover
+from condor.full_text import FullTextCache
+from condor.models.base import AuditableMixing, DeclarativeBase, eid_gen
+from condor.normalize import LatexAccentRemover, get_normalizer
 from condor.record import record_iterator_class
-from condor.util import full_text_from_pdf
 
 
 class Document(AuditableMixing, DeclarativeBase):
@@ -42,8 +45,27 @@ class Document(AuditableMixing, DeclarativeBase):
         :param normalizer_class: normalizer for the data
         :return: list of normalized data
         """
-        normalizer = normalizer_class(language=self.language)
-        data = " ".join(getattr(self, field) for field in fields)
+        return Document.normalized_words(
+            {field: getattr(self, field) for field in fields},
+            fields,
+            self.language,
+            normalizer_class,
+        )
+
+    @staticmethod
+    def normalized_words(values, fields, language, normalizer_class):
+        """
+        Normalizes the given fields of a document, without the document so
+        that worker processes can do it.
+
+        :param values: dict from field names to their text
+        :param fields: fields of interest, in order
+        :param language: language of the document
+        :param normalizer_class: normalizer for the data
+        :return: list of normalized data
+        """
+        normalizer = get_normalizer(normalizer_class, language)
+        data = " ".join(values[field] for field in fields)
         return normalizer.apply_to(data).split()
 
     @property
@@ -57,22 +79,55 @@ class Document(AuditableMixing, DeclarativeBase):
         return " ".join(open(self.full_text_path).read().split("\n"))
 
     @staticmethod
-    def load_full_text(record, files, force=False):
+    def _pdf_name(record):
         accent_remover = LatexAccentRemover()
         filename = accent_remover.apply_to(record.get("file", ""))
         if not filename:
-            return
-        basename = os.path.basename(":".join(filename.split(":")[:-1]))
+            return None
+        return os.path.basename(":".join(filename.split(":")[:-1]))
+
+    @staticmethod
+    def _legacy_full_text_path(record):
         full_text_path = os.path.join(
             FULL_TEXT_PATH, record.get("hash", "lost") + ".txt"
         )
-        if not force and os.path.exists(full_text_path):
-            return full_text_path
-        if basename in files:
-            with open(full_text_path, "w") as output:
-                output.write(full_text_from_pdf(files[basename]))
+        if os.path.exists(full_text_path):
             return full_text_path
 
+    @staticmethod
+    def load_full_text(record, files, force=False):
+        return Document.load_full_texts([record], files, force=force)[0]
+
+    @staticmethod
+    def load_full_texts(records, files, force=False, jobs=1, timeout=None):
+        """
+        Finds the full text of many records, extracting their pdf files.
+
+        :param records: list of record mappings
+        :param files: dict from pdf file names to their paths
+        :param force: extract again pdf files that are already cached
+        :param jobs: number of processes extracting pdf files
+        :param timeout: seconds to wait for a single pdf file
+        :return: list of full text paths, `None` when there is no text
+        """
+        pdf_names = [Document._pdf_name(record) for record in records]
+        pdf_paths = [files.get(name) if name else None for name in pdf_names]
+        texts = FullTextCache().extract_many(
+            [path for path in pdf_paths if path is not None],
+            jobs=jobs,
+            timeout=timeout,
+            force=force,
+        )
+        full_texts = []
+        for record, pdf_name, pdf_path in zip(records, pdf_names, pdf_paths):
+            if pdf_path is not None:
+                full_texts.append(texts.get(pdf_path))
+            elif pdf_name and not force:
+                full_texts.append(Document._legacy_full_text_path(record))
+            else:
+                full_texts.append(None)
+        return full_texts
+
     @staticmethod
     def mappings_from_files(
         record_type,
@@ -80,6 +135,8 @@ class Document(AuditableMixing, DeclarativeBase):
         full_text_path=None,
         force=False,
         show_progress_bar=False,
+        jobs=1,
+        timeout=None,
         **kwargs
     ):
         """
@@ -90,57 +147,148 @@ class Document(AuditableMixing, DeclarativeBase):
         :param kwargs: extra fields to include in the mappings
         :param full_text_path: path to look for full text pdf files
         :param force: force reading the full text from pdf files
+        :param jobs: number of processes parsing files and extracting pdf
+            files
+        :param timeout: seconds to wait for a single pdf file
         :return: an iterable over mappings
         """
-        iterator_class = record_iterator_class(record_type)
-        if full_text_path:
-            full_text_files = {
-                os.path.basename(path): path
-                for path in glob.glob(full_text_path + "**/*.pdf", recursive=True)
-            }
-        else:
-            full_text_files = None
-
-        if show_progress_bar:
-            return Document._mappings_with_progress_bar(
-                iterator_class, files, full_text_files, full_text_path, force, **kwargs
-            )
-
         records = dict()
-        for file in files:
-            for record in iterator_class(file):
-                record["keywords"] = "; ".join(record.get("keywords", ""))
-                record.update(kwargs)
-                records[record["hash"]] = record
-                if full_text_path:
-                    record["full_text_path"] = Document.load_full_text(
-                        record, full_text_files, force=force
-                    )
-                record.pop("file", None)
-        return [record for record in records.values()]
+        for record in Document._iter_records(
+            record_type, files, show_progress_bar=show_progress_bar,
+            jobs=jobs, **kwargs
+        ):
+            records[record["hash"]] = record
+        records = list(records.values())
+        Document._finish_mappings(
+            records, Document._full_text_files(full_text_path), force=force,
+            jobs=jobs, timeout=timeout,
+        )
+        return records
 
     @staticmethod
-    def _mappings_with_progress_bar(
-        iterator_class, files, full_text_files, full_text_path, force, **kwargs
+    def iter_mapping_batches(
+        record_type,
+        files,
+        batch_size=1000,
+        full_text_path=None,
+        force=False,
+        show_progress_bar=False,
+        jobs=1,
+        timeout=None,
+        **kwargs
     ):
-        records = dict()
-        for file in tqdm(files, desc="processing files", unit="file"):
-            progress_bar = tqdm(
-                iterator_class(file),
-                desc="processing records",
-                unit="record",
-                leave=False,
+        """
+        Streams document mappings out of files in batches.
+
+        Unlike `mappings_from_files` records are only deduplicated within a
+        batch, the last record with a given hash wins.
+
+        :param record_type: type of record to extract
+        :param files: files to read
+        :param batch_size: maximum number of mappings per batch
+        :param full_text_path: path to look for full text pdf files
+        :param force: force reading the full text from pdf files
+        :param show_progress_bar: show the progress of the files
+        :param jobs: number of processes parsing files and extracting pdf
+            files
+        :param timeout: seconds to wait for a single pdf file
+        :param kwargs: extra fields to include in the mappings
+        :return: an iterable over lists of mappings
+        """
+        full_text_files = Document._full_text_files(full_text_path)
+        batch = dict()
+        for record in Document._iter_records(
+            record_type, files, show_progress_bar=show_progress_bar,
+            jobs=jobs, **kwargs
+        ):
+            batch[record["hash"]] = record
+            if len(batch) >= batch_size:
+                records = list(batch.values())
+                Document._finish_mappings(
+                    records, full_text_files, force=force, jobs=jobs,
+                    timeout=timeout,
+                )
+                yield records
+                batch = dict()
+        if batch:
+            records = list(batch.values())
+            Document._finish_mappings(
+                records, full_text_files, force=force, jobs=jobs,
+                timeout=timeout,
             )
-            for record in progress_bar:
+            yield records
+
+    @staticmethod
+    def _iter_records(record_type, files, show_progress_bar=False, jobs=1,
+                      **kwargs):
+        file_records = Document._iter_file_records(
+            record_type, files, show_progress_bar=show_progress_bar, jobs=jobs
+        )
+        for records in file_records:
+            if show_progress_bar:
+                records = tqdm(
+                    records,
+                    desc="processing records",
+                    unit="record",
+                    leave=False,
+                )
+            for record in records:
                 record["keywords"] = "; ".join(record.get("keywords", ""))
                 record.update(kwargs)
-                records[record["hash"]] = record
-                if full_text_path:
-                    record["full_text_path"] = Document.load_full_text(
-                        record, full_text_files, force=force
-                    )
-                record.pop("file", None)
-        return [record for record in records.values()]
+                yield record
+
+    @staticmethod
+    def _iter_file_records(record_type, files, show_progress_bar=False,
+                           jobs=1):
+        """
+        Iterates over the records of every file, in the order of the files.
+
+        With many jobs the files on disk are parsed by a pool of processes,
+        the records of each file come back in a list. Only a few more files
+        than jobs are parsed ahead of the consumer so memory does not grow
+        with the number of files, and files are decoded with the encoding
+        they were opened with. Otherwise iterators that can parse a single
+        file on many processes get the jobs.
+        """
+        def progress(iterable):
+            if not show_progress_bar:
+                return iterable
+            return tqdm(iterable, total=len(files),
+                        desc="processing files", unit="file")
+
+        paths = [getattr(file, "name", None) for file in files]
+        parallel = jobs > 1 and len(paths) > 1 and all(
+            isinstance(path, str) and os.path.isfile(path) for path in paths
+        )
+        if not parallel:
+            iterator_class = record_iterator_class(record_type)
+            options = {"jobs": jobs} if iterator_class.parallel else {}
+            for file in progress(files):
+                yield iterator_class(file, **options)
+            return
+        yield from progress(_parallel_file_records(record_type, files, jobs))
+
+    @staticmethod
+    def _full_text_files(full_text_path):
+        if not full_text_path:
+            return None
+        return {
+            os.path.basename(path): path
+            for path in glob.glob(full_text_path + "**/*.pdf", recursive=True)
+        }
+
+    @staticmethod
+    def _finish_mappings(records, full_text_files, force=False, jobs=1,
+                         timeout=None):
+        if full_text_files is not None:
+            full_text_paths = Document.load_full_texts(
+                records, full_text_files, force=force, jobs=jobs,
+                timeout=timeout,
+            )
+            for record, path in zip(records, full_text_paths):
+                record["full_text_path"] = path
+        for record in records:
+            record.pop("file", None)
 
     @classmethod
     def list(cls, database, bibliography_eid, count=None):
@@ -153,6 +301,78 @@ class Document(AuditableMixing, DeclarativeBase):
             query = query.limit(count)
         return query.all()
 
+    @classmethod
+    def insert_many(cls, connection, mappings):
+        """
+        Inserts documents with a single executemany statement.
+
+        Eids and timestamps are computed up front instead of running the
+        column defaults once per row.
+
+        :param connection: sqlalchemy connection to write to
+        :param mappings: list of document mappings
+        :return: eids of the new documents, in order
+        """
+        if not mappings:
+            return []
+        now = datetime.utcnow()
+        rows = [
+            dict(cls._row(mapping), eid=eid_gen(), created=now, modified=now)
+            for mapping in mappings
+        ]
+        connection.execute(cls.__table__.insert(), rows)
+        return [row["eid"] for row in rows]
+
+    @classmethod
+    def update_many(cls, connection, eids, mappings):
+        """
+        Overwrites documents with a single executemany statement.
+
+        :param connection: sqlalchemy connection to write to
+        :param eids: eids of the documents to overwrite
+        :param mappings: list of document mappings, one per eid
+        """
+        if not mappings:
+            return
+        table = cls.__table__
+        now = datetime.utcnow()
+        rows = [
+            dict(cls._row(mapping), document_eid=eid, modified=now)
+            for eid, mapping in zip(eids, mappings)
+        ]
+        statement = table.update().where(
+            table.c.eid == bindparam("document_eid")
+        ).values({
+            column: bindparam(column) for column in rows[0]
+            if column != "document_eid"
+        })
+        connection.execute(statement, rows)
+
+    @classmethod
+    def _row(cls, mapping):
+        return {
+            column.name: mapping.get(column.name)
+            for column in cls.__table__.columns
+            if column.name not in ("eid", "created", "modified")
+        }
+
+    @classmethod
+    def find_many(cls, database, eids, chunk_size=500):
+        """
+        Finds the documents with the given eids, in the same order.
+
+        :param database: sqlalchemy session to find the documents
+        :param eids: list of complete eids to look for
+        :param chunk_size: maximum number of eids to send in one query
+        :return: list of documents, missing documents are left out
+        """
+        found = {}
+        for start in range(0, len(eids), chunk_size):
+            chunk = eids[start:start + chunk_size]
+            query = database.query(cls).filter(cls.eid.in_(chunk))
+            found.update((document.eid, document) for document in query)
+        return [found[eid] for eid in eids if eid in found]
+
     @classmethod
     def count(cls, database, bibliography_eid):
         """
@@ -160,3 +380,34 @@ class Document(AuditableMixing, DeclarativeBase):
         """
         query = database.query(cls).filter(cls.bibliography_eid == bibliography_eid)
         return query.count()
+
+
+def _parse_file(record_type, path, encoding=None, errors=None):
+    """
+    Parses all the records of a file in a worker process.
+    """
+    with open(path, encoding=encoding, errors=errors) as file:
+        return list(record_iterator_class(record_type)(file))
+
+
+def _parallel_file_records(record_type, files, jobs):
+    """
+    Parses files across a pool of processes keeping at most `2 * jobs`
+    files in flight.
+
+    :return: the records of every file, in lists, in the order of the files
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = collections.deque()
+        for file in files:
+            pending.append(pool.submit(
+                _parse_file,
+                record_type,
+                file.name,
+                getattr(file, "encoding", None),
+                getattr(file, "errors", None),
+            ))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -3,13 +3,19 @@ import json
 import os
 
 import numpy
+import scipy.sparse
 
 from sqlalchemy import Column, ForeignKey, Unicode
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import object_session, relationship
 
-from condor.config import MODEL_PATH
+from condor.cache import CachedIndex, CachedRanking, ranking_cache
+from condor.config import MODEL_PATH, PIN_MATRICES
+from condor.linalg import truncated_svd
 from condor.models.base import AuditableMixing, DeclarativeBase
-from condor.util import frequency
+from condor.index import InvertedIndex
+from condor.models.document import Document
+from condor.models.term_document_matrix import TermDocumentMatrix
+from condor.util import encode_query
 
 
 class RankingMatrix(AuditableMixing, DeclarativeBase):
@@ -30,30 +36,72 @@ class RankingMatrix(AuditableMixing, DeclarativeBase):
         back_populates='ranking_matrices',
     )
     
+    kinds = ('lsa', 'factored-lsa', 'bm25')
+
     @classmethod
-    def lsa_from_term_document_matrix(cls, term_document_matrix, covariance):
-        """Builds an lsa ranking matrix.
-   
-        This will ccut the matrix so taht it keeps the given covariance.
-   
+    def from_term_document_matrix(cls, term_document_matrix, kind='lsa',
+                                  covariance=0.8, rank=None, engine='full',
+                                  k1=1.2, b=0.75):
+        """Builds a ranking matrix of the given kind.
+
         :param term_document_matrix: term document matrix to use
-        :param float covariance: amount of covariance to keep.
+        :param str kind: one of the `kinds` of ranking matrices.
+        :param float covariance: amount of covariance to keep in lsa kinds.
+        :param int rank: amount of singular values to keep in lsa kinds.
+        :param str engine: either `full` or `randomized` for lsa kinds.
+        :param float k1: term frequency saturation for bm25.
+        :param float b: document length normalization for bm25.
         :returns: the ranking matrix
         """
-        u, s, v = numpy.linalg.svd(term_document_matrix.matrix,
-                                   full_matrices=False)
-        ss = s / numpy.sum(s)
-        ss = numpy.cumsum(ss)
-        k = numpy.sum(ss < covariance)
-        bounded = numpy.dot(numpy.diag(s[:k]), v[:k, :])
-        ranking = numpy.dot(u[:, :k], bounded)
-        options = json.dumps({'covariance': covariance})
+        if kind == 'lsa':
+            return cls.lsa_from_term_document_matrix(
+                term_document_matrix,
+                covariance=covariance, rank=rank, engine=engine,
+            )
+        if kind == 'factored-lsa':
+            return cls.factored_lsa_from_term_document_matrix(
+                term_document_matrix,
+                covariance=covariance, rank=rank, engine=engine,
+            )
+        if kind == 'bm25':
+            return cls.bm25_from_term_document_matrix(
+                term_document_matrix, k1=k1, b=b
+            )
+        raise ValueError('Unknown ranking kind {}'.format(kind))
 
-        unique_hash = hashlib.sha1(
-            '{}{}'.format(term_document_matrix.matrix_path, options).encode()
-        ).hexdigest()
+    @classmethod
+    def lsa_from_term_document_matrix(cls, term_document_matrix,
+                                      covariance=0.8, rank=None,
+                                      engine='full'):
+        """Builds an lsa ranking matrix.
+
+        This will cut the matrix so that it keeps the given covariance, or
+        the given rank if any.
 
-        ranking_filename = os.path.join(MODEL_PATH, unique_hash + '.npy')
+        The `full` engine computes the whole singular value decomposition
+        and measures the covariance as a fraction of the sum of the singular
+        values. The `randomized` engine only computes the leading singular
+        values, works on sparse matrices directly and measures the
+        covariance as a fraction of the matrix energy, the sum of the
+        squared singular values, since the sum of the singular values can
+        not be known without the whole spectrum, see
+        :func:`condor.linalg.truncated_svd`. The same covariance keeps fewer
+        singular values with the `randomized` engine.
+
+        :param term_document_matrix: term document matrix to use
+        :param float covariance: amount of covariance to keep.
+        :param int rank: amount of singular values to keep instead.
+        :param str engine: either `full` or `randomized`.
+        :returns: the ranking matrix
+        """
+        u, s, v = cls._svd(term_document_matrix.matrix,
+                           covariance=covariance, rank=rank, engine=engine)
+        bounded = numpy.dot(numpy.diag(s), v)
+        ranking = numpy.dot(u, bounded)
+        options = cls._lsa_options(covariance, rank, engine)
+        ranking_filename = cls._ranking_filename(
+            term_document_matrix, options, '.npy'
+        )
         numpy.save(ranking_filename, ranking)
 
         return cls(
@@ -63,43 +111,318 @@ class RankingMatrix(AuditableMixing, DeclarativeBase):
             term_document_matrix_eid=term_document_matrix.eid
         )
 
+    @classmethod
+    def factored_lsa_from_term_document_matrix(cls, term_document_matrix,
+                                               covariance=0.8, rank=None,
+                                               engine='full'):
+        """Builds an lsa ranking that keeps the factors of the decomposition.
+
+        Instead of the documents by terms ranking matrix this keeps `u`, `s`
+        and `v`, so queries are projected into the latent space and scored
+        against the document vectors there, the scores are the same as the
+        ones of a plain lsa ranking matrix.
+
+        :param term_document_matrix: term document matrix to use
+        :param float covariance: amount of covariance to keep.
+        :param int rank: amount of singular values to keep instead.
+        :param str engine: either `full` or `randomized`.
+        :returns: the ranking matrix
+        """
+        u, s, v = cls._svd(term_document_matrix.matrix,
+                           covariance=covariance, rank=rank, engine=engine)
+        options = cls._lsa_options(covariance, rank, engine)
+        ranking_filename = cls._ranking_filename(
+            term_document_matrix, options, '.npz'
+        )
+        numpy.savez(ranking_filename, u=u, s=s, v=v)
+
+        return cls(
+            kind='factored-lsa',
+            build_options=options,
+            ranking_matrix_path=ranking_filename,
+            term_document_matrix_eid=term_document_matrix.eid
+        )
+
+    @classmethod
+    def bm25_from_term_document_matrix(cls, term_document_matrix,
+                                       k1=1.2, b=0.75):
+        """Builds a bm25 ranking backed by an inverted index.
+
+        The index needs the raw term counts, they are computed again from
+        the documents if the term document matrix is regularised.
+
+        :param term_document_matrix: term document matrix to use
+        :param float k1: term frequency saturation.
+        :param float b: document length normalization.
+        :returns: the ranking matrix
+        """
+        index = InvertedIndex.from_counts(term_document_matrix.counts(),
+                                          k1=k1, b=b)
+        options = json.dumps({'k1': k1, 'b': b})
+        ranking_filename = cls._ranking_filename(
+            term_document_matrix, options, '.npz'
+        )
+        index.save(ranking_filename)
+
+        return cls(
+            kind='bm25',
+            build_options=options,
+            ranking_matrix_path=ranking_filename,
+            term_document_matrix_eid=term_document_matrix.eid
+        )
+
+    @classmethod
+    def bm25_from_bibliography(cls, bibliography, fields=None,
+                               normalizer_class=None, k1=1.2, b=0.75):
+        """Builds a bm25 ranking straight from a bibliography.
+
+        A term document matrix with the raw counts is built along the way
+        and attached to the ranking, so adding the ranking to a database
+        session stores both.
+
+        :param bibliography: a document set
+        :param fields: fields of interest
+        :param normalizer_class: normalizer class to use
+        :param float k1: term frequency saturation.
+        :param float b: document length normalization.
+        :returns: the ranking matrix
+        """
+        term_document_matrix = TermDocumentMatrix.from_bibliography_set(
+            bibliography, regularise=False, fields=fields,
+            normalizer_class=normalizer_class,
+        )
+        ranking = cls.bm25_from_term_document_matrix(
+            term_document_matrix, k1=k1, b=b
+        )
+        ranking.term_document_matrix = term_document_matrix
+        return ranking
+
+    @staticmethod
+    def _lsa_options(covariance, rank, engine):
+        return json.dumps({
+            'covariance': covariance,
+            'rank': rank,
+            'engine': engine,
+        })
+
+    @staticmethod
+    def _ranking_filename(term_document_matrix, options, extension):
+        unique_hash = hashlib.sha1(
+            '{}{}'.format(term_document_matrix.matrix_path, options).encode()
+        ).hexdigest()
+        return os.path.join(MODEL_PATH, unique_hash + extension)
+
+    @staticmethod
+    def _svd(matrix, covariance=None, rank=None, engine='full'):
+        """
+        Computes the singular triplets to keep for an lsa model.
+
+        :param matrix: dense or sparse term document matrix
+        :param float covariance: amount of covariance to keep.
+        :param int rank: amount of singular values to keep instead.
+        :param str engine: either `full` or `randomized`.
+        :returns: a tuple `(u, s, v)` with the kept singular triplets
+        """
+        if engine == 'randomized':
+            return truncated_svd(matrix, rank=rank, covariance=covariance)
+        if engine != 'full':
+            raise ValueError('Unknown svd engine {}'.format(engine))
+        if scipy.sparse.issparse(matrix):
+            matrix = matrix.toarray()
+        u, s, v = numpy.linalg.svd(matrix, full_matrices=False)
+        if rank is not None:
+            k = rank
+        else:
+            ss = s / numpy.sum(s)
+            ss = numpy.cumsum(ss)
+            k = numpy.sum(ss < covariance)
+        return u[:, :k], s[:k], v[:k, :]
+
     @property
     def matrix(self):
-        return numpy.load(self.ranking_matrix_path)
+        """
+        Load the ranking matrix stored off site as a read only memory map.
+        """
+        return self.load_matrix()
+
+    def load_matrix(self, pin=PIN_MATRICES):
+        """
+        Load the ranking matrix stored off site.
+
+        The matrix is memory mapped read only so that processes share it
+        through the OS page cache and queries only read the pages they need.
+
+        :param pin: load the matrix in memory instead of mapping it.
+        :return: a numpy array
+        """
+        return numpy.load(self.ranking_matrix_path,
+                          mmap_mode=None if pin else 'r')
+
+    @property
+    def index(self):
+        """
+        Load the inverted index of a bm25 ranking.
+        """
+        return InvertedIndex.load(self.ranking_matrix_path)
+
+    @property
+    def factors(self):
+        """
+        Load the `u`, `s` and `v` factors of a factored lsa ranking.
+        """
+        with numpy.load(self.ranking_matrix_path) as factors:
+            return factors['u'], factors['s'], factors['v']
 
-    def query(self, tokens, limit=None, cosine=None):
+    def load_cached_ranking(self):
+        """
+        Loads the data needed to answer queries, use `ranking_cache` to get
+        it instead of calling this directly.
+
+        :return: a `CachedRanking` for this ranking matrix
+        """
+        term_index = self.term_document_matrix.term_index
+        document_eids = self.term_document_matrix.document_eids
+        if self.kind == 'bm25':
+            return CachedIndex(self.index, term_index,
+                               document_eids=document_eids)
+        if self.kind == 'factored-lsa':
+            u, s, v = self.factors
+            return CachedRanking(u * s, term_index, projection=v,
+                                 document_eids=document_eids)
+        return CachedRanking(self.matrix, term_index,
+                             document_eids=document_eids)
+
+    def query(self, tokens, limit=None, cosine=None, language=None):
         """
         Find the most relevant documents in the index given this tokens.
 
-        The tokens are normalized and language guessed internally! So no
-        worries, just pass in the tokens as entered by the user.
+        The tokens are normalized internally! So no worries, just pass in
+        the tokens as entered by the user. They are normalized for the
+        given language, the dominant language of the documents by default.
+        Use `'auto'` to guess the language of every query instead, matrices
+        that do not know their dominant language always guess it.
 
         :param tokens: query string to search
         :param limit: limit of documents to use
         :param cosine: limit cosine to use
+        :param language: language of the query
         :return: list of documents
         """
+        return self.query_many([tokens], limit=limit, cosine=cosine,
+                               language=language)[0]
 
-        freq = frequency(self.term_document_matrix.words, tokens)
+    def query_language(self, language=None):
+        """
+        Language used to normalize queries, `None` when it has to be guessed.
 
-        if numpy.allclose(freq, 0):
-            return []
+        :param language: language asked for, see `query`
+        :return: the language name or `None`
+        """
+        if language == 'auto':
+            return None
+        return language or self.term_document_matrix.language
 
-        documents = self.term_document_matrix.bibliography.documents
-        dot = numpy.dot(self.matrix, freq)
-        norm_rank = numpy.linalg.norm(self.matrix, axis=1)
-        norm_freq = numpy.linalg.norm(freq)
-        cos = dot / (norm_rank * norm_freq)
+    def query_many(self, queries, limit=None, cosine=None, language=None):
+        """
+        Find the most relevant documents for many queries at once.
 
-        ordered = reversed(sorted(zip(documents, cos), key=lambda i: i[1]))
+        All the queries are scored with a single matrix product, see
+        `query` for the details of each query. Bm25 rankings search their
+        inverted index once per query instead, and the `cosine` limit
+        applies to their bm25 scores.
 
-        if limit is None and cosine is None:
-            limit = 10
+        :param queries: list of token lists, one per query
+        :param limit: limit of documents to use
+        :param cosine: limit cosine to use
+        :param language: language of the queries, see `query`
+        :return: list of lists of documents, one per query
+        """
+        cached = ranking_cache.get(self)
+        language = self.query_language(language)
+        normalizer_class = self.term_document_matrix.normalizer_class
+        encoded = [
+            encode_query(cached.term_index, tokens, language=language,
+                         normalizer_class=normalizer_class)
+            for tokens in queries
+        ]
+        empty = numpy.array([len(columns) == 0 for columns, _ in encoded],
+                            dtype=bool)
 
-        if cosine is not None:
-            return [
-                r for r in ordered
-                if r[1] > cosine
+        if self.kind == 'bm25':
+            selections = [
+                cached.index.search(columns, counts,
+                                    limit=limit, threshold=cosine)
+                for columns, counts in encoded
             ]
+        else:
+            cos = numpy.zeros((len(cached.norms), len(queries)))
+            if not numpy.all(empty):
+                cos[:, ~empty] = cached.cosines_many(self._query_matrix(
+                    [encoded[row] for row in numpy.flatnonzero(~empty)],
+                    len(cached.term_index),
+                ))
+            selections = []
+            for column in range(len(queries)):
+                selected = self._select(cos[:, column],
+                                        limit=limit, cosine=cosine)
+                selections.append((selected, cos[selected, column]))
 
-        return list(ordered)[:limit]
+        selections = [
+            ([], []) if empty[column] else selection
+            for column, selection in enumerate(selections)
+        ]
+        eids = {
+            cached.document_eids[row]
+            for selected, _ in selections
+            for row in selected
+        }
+        documents = {
+            document.eid: document
+            for document in Document.find_many(object_session(self),
+                                               list(eids))
+        }
+        return [
+            [
+                (documents[cached.document_eids[row]], score)
+                for row, score in zip(selected, scores)
+                if cached.document_eids[row] in documents
+            ]
+            for selected, scores in selections
+        ]
+
+    @staticmethod
+    def _query_matrix(encoded, terms):
+        """
+        Stacks sparse query vectors from `encode_query` into a queries by
+        terms scipy CSR matrix.
+        """
+        indptr = numpy.cumsum([0] + [len(columns) for columns, _ in encoded])
+        return scipy.sparse.csr_matrix(
+            (
+                numpy.concatenate([counts for _, counts in encoded]),
+                numpy.concatenate([columns for columns, _ in encoded]),
+                indptr,
+            ),
+            shape=(len(encoded), terms),
+        )
+
+    @staticmethod
+    def _select(cos, limit=None, cosine=None):
+        """
+        Selects the best rows of a cosine array without sorting all of them.
+
+        :param cos: array of cosines, one per document
+        :param limit: limit of documents to use
+        :param cosine: limit cosine to use, it takes precedence over limit
+        :return: array of rows sorted by decreasing cosine
+        """
+        if limit is None and cosine is None:
+            limit = 10
+        ranked = numpy.where(numpy.isnan(cos), -numpy.inf, cos)
+        if cosine is not None:
+            selected = numpy.flatnonzero(ranked > cosine)
+        elif limit < len(ranked):
+            selected = numpy.argpartition(-ranked, limit)[:limit]
+        else:
+            selected = numpy.arange(len(ranked))
+        return selected[numpy.argsort(-ranked[selected], kind='stable')]
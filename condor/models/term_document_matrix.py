@@ -1,19 +1,28 @@
 """
 Just a normal text document matrix representation, the actual matrix is
-stored off site on a numpy file.
+stored off site on a numpy file, or on a scipy sparse file for sparse
+matrices.
 """
+import collections
+import concurrent.futures
+import functools
 import hashlib
+import importlib
+import json
 import os
+import re
 
 import numpy
-from nltk import collections
+import scipy.sparse
 
 from sqlalchemy import Column, ForeignKey, Unicode
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import object_session, relationship
 
-from condor.config import MATRIX_PATH, TERM_LIST_PATH
+from condor.config import MATRIX_PATH, PIN_MATRICES, TERM_LIST_PATH
 from condor.models.base import AuditableMixing, DeclarativeBase
+from condor.models.document import Document
 from condor.normalize import CompleteNormalizer
+from condor.term_list import TermList
 
 
 class TermDocumentMatrix(AuditableMixing, DeclarativeBase):
@@ -46,7 +55,8 @@ class TermDocumentMatrix(AuditableMixing, DeclarativeBase):
 
     @classmethod
     def from_bibliography_set(cls, bibliography, regularise=True,
-                              fields=None, normalizer_class=None):
+                              fields=None, normalizer_class=None,
+                              sparse=True, jobs=1):
         """
         Build a matrix from a document set.
 
@@ -56,27 +66,22 @@ class TermDocumentMatrix(AuditableMixing, DeclarativeBase):
         :param regularise: apply TF IDF regularization.
         :param fields: fields of interest
         :param normalizer_class: normalizer class to use
+        :param sparse: store the matrix in a sparse (CSR) format, use
+            `False` to get a dense matrix, handy only for small sets.
+        :param jobs: number of processes normalizing the documents
         :return: a term document matrix.
         """
         fields = fields or ['title', 'description', 'keywords']
         normalizer_class = normalizer_class or CompleteNormalizer
-        words = bibliography.words(fields=fields,
-                                       normalizer_class=CompleteNormalizer)
-        frequency = numpy.zeros(
-            (len(bibliography.documents), len(words)),
-            dtype=int
-        )
-        for row, col, freq in cls._matrix(words,
-                                          bibliography,
-                                          fields,
-                                          normalizer_class):
-            frequency[row][col] = freq
+        words, frequency = cls._count(bibliography.documents, fields,
+                                      normalizer_class, jobs=jobs)
+        document_frequency = numpy.bincount(frequency.indices,
+                                            minlength=len(words))
+        if not sparse:
+            frequency = frequency.toarray()
 
         if regularise:
-            tf = (frequency.T / numpy.sum(frequency, axis=1)).T
-            df = numpy.sum(frequency > 0, axis=0)
-            idf = numpy.log(len(bibliography.documents) / df) + 1
-            frequency = tf * idf
+            frequency = cls._tf_idf(frequency)
 
         unique_hash = hashlib.sha1(
             '{}{}{}{}'.format(
@@ -86,13 +91,18 @@ class TermDocumentMatrix(AuditableMixing, DeclarativeBase):
                 regularise
             ).encode()
         ).hexdigest()
-        matrix_filename = os.path.join(MATRIX_PATH, unique_hash + '.npy')
-        words_filename = os.path.join(TERM_LIST_PATH, unique_hash + '.txt')
-        numpy.save(matrix_filename, frequency)
-        with open(words_filename, 'w') as file:
-            file.write('\n'.join(words))
+        words_filename, matrix_filename = cls._save(
+            unique_hash, words, frequency, document_frequency,
+            [document.eid for document in bibliography.documents],
+        )
         return cls(
-            bibliography_options='',
+            bibliography_options=json.dumps({
+                'fields': fields,
+                'regularise': regularise,
+                'language': cls._dominant_language(
+                    document.language for document in bibliography.documents
+                ),
+            }),
             processing_options=str(normalizer_class.__mro__),
             term_list_path=words_filename,
             matrix_path=matrix_filename,
@@ -100,26 +110,479 @@ class TermDocumentMatrix(AuditableMixing, DeclarativeBase):
         )
 
     @staticmethod
-    def _matrix(words, bibliography, fields, normalizer_class):
+    def _dominant_language(languages):
+        """
+        Most common of the languages of some documents, `None` if there are
+        none.
+        """
+        languages = collections.Counter(
+            language.lower() for language in languages if language
+        )
+        if not languages:
+            return None
+        return languages.most_common(1)[0][0]
+
+    def update(self, jobs=1):
+        """
+        Builds a new matrix with the changes of the bibliography since this
+        matrix was built.
+
+        Only the documents added or overwritten after the matrix was built
+        are normalized, using the normalizer the matrix was built with.
+        Their words are merged into the vocabulary, the rows of overwritten
+        documents are replaced and the rows of new documents are appended.
+        Regularised matrices rescale the stored entries in place with the
+        new inverse document frequencies, which come from the document
+        frequencies kept next to the matrix, so the result matches a matrix
+        built from scratch up to the order of the rows.
+
+        This has the side effect of creating the matrix and terms files of
+        the new matrix, the files of this matrix are left untouched. The
+        stored matrix is read once, dense matrices are rewritten whole.
+
+        :param jobs: number of processes normalizing the documents
+        :return: a new term document matrix, or `None` when no document
+            changed
+        :raises ValueError: for matrices that did not store the list of
+            their documents, build those again with `from_bibliography_set`
+        """
+        database = object_session(self)
+        if not os.path.exists(self._document_list_path(self.matrix_path)):
+            raise ValueError(
+                'The matrix {} does not know which documents it holds, '
+                'build a new one instead'.format(self.eid)
+            )
+        document_eids = self.document_eids
+        rows = {eid: row for row, eid in enumerate(document_eids)}
+        new_eids, changed_eids = [], []
+        for eid, modified in database.query(
+            Document.eid, Document.modified
+        ).filter(Document.bibliography_eid == self.bibliography_eid):
+            if eid not in rows:
+                new_eids.append(eid)
+            elif modified > self.created:
+                changed_eids.append(eid)
+        if not new_eids and not changed_eids:
+            return None
+
+        matrix = scipy.sparse.csr_matrix(self.matrix)
+        if matrix.shape[0] != len(document_eids):
+            raise ValueError(
+                'The matrix {} has {} rows for {} documents, build a new one '
+                'instead'.format(self.eid, matrix.shape[0], len(document_eids))
+            )
+        options = self.options
+        fields = options.get('fields') or ['title', 'description', 'keywords']
+        documents = Document.find_many(database, changed_eids + new_eids)
+        counted_words, counts = self._count(
+            documents, fields, self.normalizer_class, jobs=jobs
+        )
+        words, old_columns, counted_columns = _merge_words(self.term_index,
+                                                           counted_words)
+        counts = scipy.sparse.csr_matrix(
+            (counts.data, counted_columns[counts.indices], counts.indptr),
+            shape=(counts.shape[0], len(words)),
+        )
+
+        old_frequency = self.document_frequency
+        changed_rows = numpy.array([rows[eid] for eid in changed_eids],
+                                   dtype=int)
+        stale = matrix[changed_rows]
+        stale.eliminate_zeros()
+        document_frequency = numpy.zeros(len(words), dtype=int)
+        document_frequency[old_columns] = old_frequency - numpy.bincount(
+            stale.indices, minlength=len(old_frequency)
+        )
+        document_frequency += numpy.bincount(counts.indices,
+                                             minlength=len(words))
+
+        regularise = options.get(
+            'regularise', not numpy.issubdtype(matrix.dtype, numpy.integer)
+        )
+        if regularise:
+            old_idf = numpy.log(matrix.shape[0] / old_frequency) + 1
+            idf = numpy.log(
+                (matrix.shape[0] + len(new_eids)) /
+                numpy.maximum(document_frequency, 1)
+            ) + 1
+            matrix.data *= (idf[old_columns] / old_idf)[matrix.indices]
+            counts = self._term_frequency(counts) @ scipy.sparse.diags(idf)
+        for row in changed_rows:
+            matrix.data[matrix.indptr[row]:matrix.indptr[row + 1]] = 0
+        matrix = scipy.sparse.csr_matrix(
+            (matrix.data, old_columns[matrix.indices], matrix.indptr),
+            shape=(matrix.shape[0], len(words)),
+        )
+        matrix.eliminate_zeros()
+        if len(changed_rows):
+            placement = scipy.sparse.csr_matrix(
+                (numpy.ones(len(changed_rows)),
+                 (changed_rows, numpy.arange(len(changed_rows)))),
+                shape=(matrix.shape[0], len(changed_rows)),
+            )
+            matrix = matrix + placement @ counts[:len(changed_rows)]
+        matrix = scipy.sparse.vstack(
+            [matrix, counts[len(changed_rows):]]
+        ).tocsr().astype(matrix.dtype)
+
+        used = document_frequency > 0
+        if not numpy.all(used):
+            matrix = matrix[:, used]
+            words = [word for word, keep in zip(words, used) if keep]
+            document_frequency = document_frequency[used]
+        if not self.is_sparse:
+            matrix = matrix.toarray()
+
+        unique_hash = hashlib.sha1(
+            '{}{}{}'.format(
+                self.eid, ''.join(new_eids), ''.join(changed_eids)
+            ).encode()
+        ).hexdigest()
+        words_filename, matrix_filename = self._save(
+            unique_hash, words, matrix, document_frequency,
+            document_eids + new_eids,
+        )
+        options['language'] = self._dominant_language(
+            language for language, in database.query(Document.language)
+            .filter(Document.bibliography_eid == self.bibliography_eid)
+        )
+        return TermDocumentMatrix(
+            bibliography_options=json.dumps(options),
+            processing_options=self.processing_options,
+            term_list_path=words_filename,
+            matrix_path=matrix_filename,
+            bibliography_eid=self.bibliography_eid,
+        )
+
+    @staticmethod
+    def _save(unique_hash, words, matrix, document_frequency, document_eids):
+        """
+        Stores the words, the matrix, the document frequencies and the
+        documents of a matrix off site.
+
+        :return: a tuple with the paths of the words and the matrix files
+        """
+        words_filename = os.path.join(TERM_LIST_PATH, unique_hash + '.terms')
+        if scipy.sparse.issparse(matrix):
+            matrix_filename = os.path.join(MATRIX_PATH, unique_hash + '.npz')
+            scipy.sparse.save_npz(matrix_filename, matrix)
+        else:
+            matrix_filename = os.path.join(MATRIX_PATH, unique_hash + '.npy')
+            numpy.save(matrix_filename, matrix)
+        TermList.write(words_filename, words)
+        numpy.save(TermDocumentMatrix._statistics_path(matrix_filename),
+                   document_frequency)
+        with open(TermDocumentMatrix._document_list_path(matrix_filename),
+                  'w') as file:
+            file.write('\n'.join(document_eids))
+        return words_filename, matrix_filename
+
+    @staticmethod
+    def _tf_idf(frequency):
+        """
+        Applies TF IDF regularisation to a dense or sparse frequency matrix.
+
+        :param frequency: documents by terms matrix of raw counts
+        :return: the regularised matrix, in the same format as the input
+        """
+        if not scipy.sparse.issparse(frequency):
+            tf = (frequency.T / numpy.sum(frequency, axis=1)).T
+            df = numpy.sum(frequency > 0, axis=0)
+            idf = numpy.log(frequency.shape[0] / df) + 1
+            return tf * idf
+        frequency = frequency.tocsr().astype(float)
+        df = numpy.bincount(frequency.indices, minlength=frequency.shape[1])
+        idf = numpy.log(frequency.shape[0] / df) + 1
+        tf = TermDocumentMatrix._term_frequency(frequency)
+        return (tf @ scipy.sparse.diags(idf)).tocsr()
+
+    @staticmethod
+    def _term_frequency(frequency):
+        """
+        Divides every row of a sparse frequency matrix by its length.
+        """
+        frequency = frequency.tocsr().astype(float)
+        lengths = numpy.asarray(frequency.sum(axis=1)).ravel()
+        inverse_lengths = numpy.divide(
+            1.0, lengths, out=numpy.zeros_like(lengths), where=lengths > 0
+        )
+        return scipy.sparse.diags(inverse_lengths) @ frequency
+
+    @staticmethod
+    def _count(documents, fields, normalizer_class, jobs=1):
+        """
+        Counts the words of the documents normalizing every document once.
+
+        Words get ids as they show up and are remapped to their position in
+        the sorted vocabulary at the end.
+
+        :param documents: list of documents, one per row
+        :param fields: fields of interest
+        :param normalizer_class: normalizer class to use
+        :param jobs: number of processes normalizing the documents
+        :return: a tuple with the sorted words and a documents by words
+            scipy CSR matrix of counts
+        """
+        if jobs > 1 and len(documents) > 1:
+            document_counts = _parallel_counts(documents, fields,
+                                               normalizer_class, jobs)
+        else:
+            document_counts = (
+                collections.Counter(
+                    document.raw_data(fields, normalizer_class)
+                )
+                for document in documents
+            )
+        vocabulary = {}
+        rows, cols, freqs = [], [], []
+        for row, counts in enumerate(document_counts):
+            for word, freq in counts.items():
+                rows.append(row)
+                cols.append(vocabulary.setdefault(word, len(vocabulary)))
+                freqs.append(freq)
+        words = sorted(vocabulary)
+        positions = numpy.empty(len(words), dtype=int)
+        positions[[vocabulary[word] for word in words]] = numpy.arange(
+            len(words)
+        )
+        frequency = scipy.sparse.csr_matrix(
+            (freqs, (rows, positions[numpy.asarray(cols, dtype=int)])),
+            shape=(len(documents), len(words)),
+            dtype=int
+        )
+        return words, frequency
+
+    @staticmethod
+    def _matrix(words, documents, fields, normalizer_class):
         word_dict = {word: pos for pos, word in enumerate(words)}
-        for ind, bib in enumerate(bibliography.documents):
+        for ind, bib in enumerate(documents):
             raw = bib.raw_data(fields, normalizer_class)
             frequency = collections.Counter(raw)
             for word, freq in frequency.items():
-                yield ind, word_dict[word], freq
+                if word in word_dict:
+                    yield ind, word_dict[word], freq
+
+    @property
+    def options(self):
+        """
+        Options used to build the matrix, empty for older matrices.
+        """
+        if not self.bibliography_options:
+            return {}
+        return json.loads(self.bibliography_options)
+
+    @property
+    def normalizer_class(self):
+        """
+        Normalizer class the matrix was built with, read back from the
+        processing options, `CompleteNormalizer` if it can not be found.
+        """
+        found = re.match(r"\(<class '([\w.]+)\.(\w+)'>",
+                         self.processing_options or '')
+        if found is None:
+            return CompleteNormalizer
+        module, name = found.groups()
+        try:
+            return getattr(importlib.import_module(module), name)
+        except (ImportError, AttributeError):
+            return CompleteNormalizer
+
+    @property
+    def language(self):
+        """
+        Dominant language of the documents, `None` for older matrices.
+        """
+        return self.options.get('language')
+
+    def counts(self):
+        """
+        Raw term counts of the documents as a sparse matrix.
+
+        Regularised matrices do not keep the raw counts so they are computed
+        again from the documents, using the fields the matrix was built
+        with.
+
+        :return: documents by terms scipy CSR matrix of counts
+        """
+        matrix = self.matrix
+        if numpy.issubdtype(matrix.dtype, numpy.integer):
+            return scipy.sparse.csr_matrix(matrix)
+        fields = self.options.get('fields') or [
+            'title', 'description', 'keywords'
+        ]
+        database = object_session(self)
+        documents = Document.find_many(database, self.document_eids)
+        rows, cols, freqs = [], [], []
+        for row, col, freq in self._matrix(self.words, documents, fields,
+                                           self.normalizer_class):
+            rows.append(row)
+            cols.append(col)
+            freqs.append(freq)
+        return scipy.sparse.csr_matrix(
+            (freqs, (rows, cols)), shape=matrix.shape, dtype=int
+        )
 
     @property
     def words(self):
         """
         Load the words stored off site.
         """
+        if self.term_list_path.endswith('.terms'):
+            return list(self.term_index)
         with open(self.term_list_path) as term_file:
             terms = term_file.read().split('\n')
         return terms
 
+    @property
+    def term_index(self):
+        """
+        Column of every word, a memory mapped `TermList` for matrices that
+        store their words in the binary format and a dict for older ones.
+        It is loaded once per matrix instance.
+        """
+        cached = getattr(self, '_term_index', None)
+        if cached is not None and cached[0] == self.term_list_path:
+            return cached[1]
+        if self.term_list_path.endswith('.terms'):
+            term_index = TermList(self.term_list_path)
+        else:
+            term_index = {
+                word: column for column, word in enumerate(self.words)
+            }
+        self._term_index = (self.term_list_path, term_index)
+        return term_index
+
+    @staticmethod
+    def _document_list_path(matrix_path):
+        return os.path.splitext(matrix_path)[0] + '.documents.txt'
+
+    @staticmethod
+    def _statistics_path(matrix_path):
+        return os.path.splitext(matrix_path)[0] + '.df.npy'
+
+    @property
+    def document_frequency(self):
+        """
+        Number of documents every word shows up in.
+
+        Matrices built before the document frequencies were stored off site
+        get them from the non zero entries of the matrix.
+        """
+        statistics_path = self._statistics_path(self.matrix_path)
+        if os.path.exists(statistics_path):
+            return numpy.load(statistics_path)
+        matrix = scipy.sparse.csc_matrix(self.matrix)
+        matrix.eliminate_zeros()
+        return numpy.diff(matrix.indptr)
+
+    @property
+    def document_eids(self):
+        """
+        Eids of the documents in the order of the rows of the matrix.
+
+        Matrices built before the document list was stored off site rely on
+        the database returning the documents in the order it used when the
+        matrix was built.
+        """
+        document_list_path = self._document_list_path(self.matrix_path)
+        if os.path.exists(document_list_path):
+            with open(document_list_path) as document_file:
+                return document_file.read().split()
+        database = object_session(self)
+        return [
+            eid for eid, in database.query(Document.eid).filter(
+                Document.bibliography_eid == self.bibliography_eid
+            )
+        ]
+
+    @property
+    def is_sparse(self):
+        """
+        Whether the matrix is stored off site in a sparse format.
+        """
+        return self.matrix_path.endswith('.npz')
+
     @property
     def matrix(self):
+        """
+        Load the matrix stored off site, sparse matrices are loaded as
+        scipy CSR matrices and dense ones as read only memory maps.
+        """
+        return self.load_matrix()
+
+    def load_matrix(self, pin=PIN_MATRICES):
         """
         Load the matrix stored off site.
+
+        Dense matrices are memory mapped read only so that processes share
+        them through the OS page cache, sparse matrices are always loaded in
+        memory.
+
+        :param pin: load dense matrices in memory instead of mapping them.
+        :return: a scipy CSR matrix or a numpy array
         """
-        return numpy.load(self.matrix_path)
+        if self.is_sparse:
+            return scipy.sparse.load_npz(self.matrix_path)
+        return numpy.load(self.matrix_path, mmap_mode=None if pin else 'r')
+
+
+def _merge_words(old_words, new_words):
+    """
+    Merges two sorted vocabularies in a single pass.
+
+    :param old_words: iterable over the sorted words of a matrix
+    :param new_words: sorted list of words to add
+    :return: a tuple with the merged words and the arrays with the merged
+        columns of the old and the new words
+    """
+    words, old_columns, new_columns = [], [], []
+    position = 0
+    for word in old_words:
+        while position < len(new_words) and new_words[position] < word:
+            new_columns.append(len(words))
+            words.append(new_words[position])
+            position += 1
+        if position < len(new_words) and new_words[position] == word:
+            new_columns.append(len(words))
+            position += 1
+        old_columns.append(len(words))
+        words.append(word)
+    for word in new_words[position:]:
+        new_columns.append(len(words))
+        words.append(word)
+    return (words, numpy.array(old_columns, dtype=int),
+            numpy.array(new_columns, dtype=int))
+
+
+def _count_shard(fields, normalizer_class, shard):
+    """
+    Counts the words of a shard of `(language, values)` pairs in a worker
+    process, the worker keeps one normalizer per language.
+    """
+    return [
+        collections.Counter(
+            Document.normalized_words(values, fields, language,
+                                      normalizer_class)
+        )
+        for language, values in shard
+    ]
+
+
+def _parallel_counts(documents, fields, normalizer_class, jobs):
+    """
+    Counts the words of every document across a pool of processes.
+
+    :return: word counters in the order of the documents
+    """
+    texts = [
+        (document.language,
+         {field: getattr(document, field) for field in fields})
+        for document in documents
+    ]
+    size = max(1, -(-len(texts) // (4 * jobs)))
+    shards = [texts[i:i + size] for i in range(0, len(texts), size)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        for counts in pool.map(functools.partial(_count_shard, fields,
+                                                 normalizer_class),
+                               shards):
+            yield from counts
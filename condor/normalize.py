@@ -4,11 +4,61 @@ be able to remove punctuation, filter out stopwords and maybe transform some
 latex accents into unicode accent characters.
 '''
 
+import functools
+import re
 import string
 
 from nltk.corpus import stopwords
 from nltk.stem.snowball import SnowballStemmer
 
+from condor.config import STEM_CACHE_SIZE
+
+
+_stemmers = {}
+_stopword_sets = {}
+
+
+def shared_stemmer(language):
+    '''
+    Snowball stemmer of a language with a memoized `stem` method, it is
+    shared by every stemmer so most tokens of a corpus are stemmed only once.
+    '''
+    if language not in _stemmers:
+        stemmer = SnowballStemmer(language)
+        stemmer.stem = functools.lru_cache(maxsize=STEM_CACHE_SIZE)(
+            stemmer.stem
+        )
+        _stemmers[language] = stemmer
+    return _stemmers[language]
+
+
+def stem_function(language):
+    '''
+    Memoized snowball stem function of a language, see `shared_stemmer`.
+    '''
+    return shared_stemmer(language).stem
+
+
+def stem_cache_info():
+    '''
+    Hits, misses and sizes of the stem caches by language.
+    '''
+    return {
+        language: stemmer.stem.cache_info()
+        for language, stemmer in _stemmers.items()
+    }
+
+
+def stopword_set(language):
+    '''
+    Stopwords of a language, loaded once per process.
+    '''
+    if language not in _stopword_sets:
+        _stopword_sets[language] = frozenset(
+            stopwords.words(fileids=language)
+        )
+    return _stopword_sets[language]
+
 
 class SpaceTokenizer(object):
 
@@ -62,11 +112,12 @@ class Stemmer(Normalizer):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.stemmer = SnowballStemmer(self.language)
+        self.stemmer = shared_stemmer(self.language)
+        self.stem = self.stemmer.stem
 
     def apply_to(self, text):
         tokens = self.tokenizer.tokenize(text)
-        result = ' '.join(self.stemmer.stem(token) for token in tokens)
+        result = ' '.join(self.stem(token) for token in tokens)
         return super().apply_to(result)
 
 
@@ -78,9 +129,7 @@ class StopwordRemover(Normalizer):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.stopwords = {
-            word: None for word in stopwords.words(fileids=self.language)
-        }
+        self.stopwords = stopword_set(self.language)
 
     def apply_to(self, text):
         tokens = self.tokenizer.tokenize(text)
@@ -168,11 +217,13 @@ class LatexAccentRemover(Normalizer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.table, self.pattern = self._compile()
 
-    def _replacements(self):
-        for accent, cases in self.accents.items():
+    @classmethod
+    def _replacements(cls):
+        for accent, cases in cls.accents.items():
             for character, modification in cases.items():
-                for format_ in self.formats:
+                for format_ in cls.formats:
                     latex = format_.format(accent=accent, character=character)
                     yield (
                         latex,
@@ -183,10 +234,27 @@ class LatexAccentRemover(Normalizer):
                         modification.upper(),
                     )
 
+    @classmethod
+    def _compile(cls):
+        '''
+        Builds the replacement table and a single regex matching any of its
+        keys, longest first, once per class.
+        '''
+        if '_compiled' not in cls.__dict__:
+            table = {}
+            for old, new in cls._replacements():
+                table.setdefault(old, new)
+            pattern = re.compile('|'.join(
+                re.escape(latex)
+                for latex in sorted(table, key=len, reverse=True)
+            ))
+            cls._compiled = (table, pattern)
+        return cls._compiled
+
     def apply_to(self, text):
-        result = text
-        for old, new in self._replacements():
-            result = result.replace(old, new)
+        result = self.pattern.sub(
+            lambda match: self.table[match.group(0)], text
+        )
         return super().apply_to(result)
 
 
@@ -201,3 +269,34 @@ class CompleteNormalizer(LatexAccentRemover,
     '''
 
     pass
+
+
+_normalizers = {}
+
+
+def get_normalizer(normalizer_class=None, language=None):
+    '''
+    Shared normalizer instance of a class and language, normalizers keep no
+    state between calls so a single instance per process is enough.
+
+    :param normalizer_class: normalizer class, `CompleteNormalizer` by default
+    :param language: language of the normalizer, its default one if missing
+    :return: the normalizer instance
+    '''
+    normalizer_class = normalizer_class or CompleteNormalizer
+    key = (normalizer_class, language.lower() if language else None)
+    if key not in _normalizers:
+        _normalizers[key] = normalizer_class(language=language)
+    return _normalizers[key]
+
+
+def warmup(languages, normalizer_class=None):
+    '''
+    Builds the normalizers of some languages ahead of time, loading the nltk
+    corpora they need, so that the first queries do not pay for it.
+
+    :param languages: names of the languages to load
+    :param normalizer_class: normalizer class, `CompleteNormalizer` by default
+    '''
+    for language in languages:
+        get_normalizer(normalizer_class, language)
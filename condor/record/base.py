@@ -58,6 +58,10 @@ class RecordIterator(object):
 
     parser_class = RecordParser
 
+    # Iterators that can parse the records of a single file on many
+    # processes take a `jobs` argument.
+    parallel = False
+
     def __init__(self, _file):
         self.file = _file
 
@@ -1,3 +1,5 @@
+import collections
+import concurrent.futures
 import hashlib
 import re
 
@@ -5,7 +7,7 @@ import bibtexparser
 
 from condor.record.base import RecordIterator
 from condor.record.base import RecordParser
-from condor.util import LanguageGuesser
+from condor.util import language_guesser
 
 from condor.normalize import LatexAccentRemover
 
@@ -16,7 +18,7 @@ class BibtexRecordParser(RecordParser):
         'description': 'abstract',
     }
 
-    guesser = LanguageGuesser()
+    guesser = language_guesser()
 
     accent_remover = LatexAccentRemover()
 
@@ -31,9 +33,11 @@ class BibtexRecordParser(RecordParser):
         return sha.hexdigest()
 
     def _clear_language(self, raw):
+        if 'language' in raw:
+            return raw['language'].lower()
         data = self.clear('title', raw) + self.clear('description', raw)
         data += ' '.join(self.clear('keywords', raw))
-        return raw.get('language', self.guesser.guess(data)).lower()
+        return self.guesser.guess(data).lower()
 
     def clear(self, field, raw):
         mapping = self.get_mapping(field)
@@ -48,15 +52,84 @@ class BibtexRecordParser(RecordParser):
         return super().parse(raw)
 
 
+def split_bibtex_records(lines):
+    '''
+    Splits a stream of bibtex lines into the raw text of its records.
+
+    Records start at lines beginning with `@`, the same boundaries
+    bibtexparser uses, so the records can be parsed one batch at a time.
+
+    :param lines: iterable over the lines of a bibtex file
+    :return: an iterable over the text of every record
+    '''
+    record = ''
+    for line in lines:
+        if line.strip().startswith('@'):
+            if record:
+                yield record
+            record = line.lstrip()
+        else:
+            record += line
+    if record:
+        yield record
+
+
+def _parse_records(text):
+    '''
+    Parses the entries of some bibtex records.
+    '''
+    return bibtexparser.loads(text).entries
+
+
 class BibtexRecordIterator(RecordIterator):
 
     '''
     Iterates over bibtex reccords
+
+    Records are parsed in batches as the file is read, optionally on a pool
+    of processes that keeps a few batches in flight. Files with `@string`
+    macros are parsed as a whole from the first macro on, since later
+    entries may use them.
     '''
 
     parser_class = BibtexRecordParser
 
+    parallel = True
+
+    batch_size = 256
+
+    def __init__(self, _file, jobs=1):
+        super().__init__(_file)
+        self.jobs = jobs
+
+    def _batches(self):
+        records = split_bibtex_records(self.file)
+        batch = []
+        for record in records:
+            if record.lower().startswith('@string'):
+                if batch:
+                    yield ''.join(batch)
+                yield record + ''.join(records)
+                return
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+
     def get_buffer(self):
-        database = bibtexparser.load(self.file)
-        for entry in database.entries:
-            yield entry
+        if self.jobs > 1:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.jobs
+            ) as pool:
+                pending = collections.deque()
+                for batch in self._batches():
+                    pending.append(pool.submit(_parse_records, batch))
+                    if len(pending) >= 2 * self.jobs:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+        else:
+            for batch in self._batches():
+                yield from _parse_records(batch)
@@ -1,6 +1,9 @@
 import hashlib
+import re
 
 from xml.dom import minidom
+from xml.parsers import expat
+from xml.sax.saxutils import quoteattr
 
 from condor.record.base import RecordIterator
 from condor.record.base import RecordParser
@@ -54,15 +57,124 @@ class FroacRecordParser(RecordParser):
         return sha.hexdigest()
 
 
+def iter_element_spans(file, tag, chunk_size=2 ** 16):
+    '''
+    Finds the elements with a given tag in a streamed xml file.
+
+    Only the bytes of the element being read are kept in memory. Nested
+    elements with the same tag are part of the outer element.
+
+    :param file: binary or text file object to read from
+    :param tag: qualified name of the elements to look for
+    :param chunk_size: bytes or characters to read at once
+    :return: an iterable over tuples `(span, namespaces, encoding)` with the
+        raw bytes of every element, the namespace declarations of its
+        ancestors and the encoding of the bytes
+    '''
+    chunk = file.read(chunk_size)
+    is_text = isinstance(chunk, str)
+    parser = expat.ParserCreate('UTF-8' if is_text else None)
+    encoding = ['UTF-8']
+    events = []
+
+    def declaration(version, declared_encoding, standalone):
+        if declared_encoding and not is_text:
+            encoding[0] = declared_encoding
+
+    def start(name, attributes):
+        events.append((parser.CurrentByteIndex, name, attributes))
+
+    def end(name):
+        events.append((parser.CurrentByteIndex, name, None))
+
+    parser.XmlDeclHandler = declaration
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+
+    closing = re.compile(re.escape('</{}'.format(tag).encode('utf-8')) +
+                         rb'[\s>]')
+    data = bytearray()
+    base = 0
+    scopes = [{}]
+    depth = 0
+    span_start = None
+    namespaces = None
+    while True:
+        if is_text:
+            chunk = chunk.encode('utf-8')
+        data.extend(chunk)
+        parser.Parse(chunk, not chunk)
+        last = base
+        for index, name, attributes in events:
+            last = index
+            if attributes is not None:
+                declarations = {
+                    key: value for key, value in attributes.items()
+                    if key == 'xmlns' or key.startswith('xmlns:')
+                }
+                scopes.append(
+                    dict(scopes[-1], **declarations) if declarations
+                    else scopes[-1]
+                )
+                if name == tag:
+                    if depth == 0:
+                        span_start = index
+                        namespaces = scopes[-2]
+                    depth += 1
+                continue
+            scopes.pop()
+            if name == tag:
+                depth -= 1
+                if depth == 0:
+                    # End events of empty elements are reported right after
+                    # the element, the ones of end tags at the end tag, an
+                    # end tag of the same element and not one that merely
+                    # starts with its name.
+                    span_end = index - base
+                    if closing.match(data, span_end):
+                        span_end = data.index(b'>', span_end) + 1
+                    yield (
+                        bytes(data[span_start - base:span_end]),
+                        namespaces,
+                        encoding[0],
+                    )
+                    span_start = None
+        events.clear()
+        keep = last if span_start is None else span_start
+        del data[:keep - base]
+        base = keep
+        if not chunk:
+            return
+        chunk = file.read(chunk_size)
+
+
 class FroacRecordIterator(RecordIterator):
 
     '''
     Iterates plain txt froac records in a file.
+
+    Records are read one at a time from the file, every record is parsed
+    on its own with the namespaces of its ancestors.
     '''
 
     parser_class = FroacRecordParser
 
     def get_buffer(self):
-        dom = minidom.parse(self.file)
-        for dom_element in dom.getElementsByTagName('record'):
-            yield dom_element
+        if isinstance(self.file, str):
+            with open(self.file, 'rb') as file:
+                yield from self._records(file)
+        else:
+            yield from self._records(self.file)
+
+    def _records(self, file):
+        for span, namespaces, encoding in iter_element_spans(file, 'record'):
+            declarations = ''.join(
+                ' {}={}'.format(key, quoteattr(value))
+                for key, value in sorted(namespaces.items())
+            )
+            document = minidom.parseString(
+                '<?xml version="1.0" encoding="{}"?><wrapper{}>'.format(
+                    encoding, declarations
+                ).encode(encoding) + span + '</wrapper>'.encode(encoding)
+            )
+            yield document.documentElement.firstChild
@@ -1,3 +1,5 @@
+import collections
+
 from condor.record.base import RecordIterator
 from condor.record.base import RecordParser
 
@@ -45,18 +47,49 @@ class IsiRecordIterator(RecordIterator):
 
     '''
     Iterates over a file with ISI txt reccords while yielding reccords.
+
+    The file can be a text file or a binary one in the given `encoding`, the
+    fields of every record are gathered while reading the lines. Unless
+    `only_mapped` is false, fields the parser does not use are skipped.
     '''
 
     parser_class = IsiRecordParser
 
+    def __init__(self, _file, encoding='utf-8', only_mapped=True):
+        super().__init__(_file)
+        self.encoding = encoding
+        self.only_mapped = only_mapped
+
+    def _lines(self):
+        for line in self.file:
+            if isinstance(line, bytes):
+                line = line.decode(self.encoding)
+            yield line.rstrip('\r\n')
+
     def get_buffer(self):
         '''
         Iterates over a file by looking for lines containing the ER mark
-        of the isi plain text files.
+        of the isi plain text files, every record is a dictionary like the
+        ones from `isi_text_to_dic`.
         '''
-        buff = []
-        for line in self.file:
-            buff.append(line)
-            if line[:2] == 'ER':
-                yield '\n'.join(buff)
-                buff = []
+        wanted = None
+        if self.only_mapped:
+            parser = self.parser_class()
+            wanted = {
+                parser.get_mapping(field) for field in parser.interest_fields
+            }
+        fields = collections.defaultdict(list)
+        current = ''
+        for line in self._lines():
+            if not line:
+                continue
+            name = line[:2]
+            if not name.isspace():
+                current = name
+            if (not current.isspace() and
+                    (wanted is None or current in wanted)):
+                fields[current].append(line[3:])
+            if name == 'ER':
+                yield fields
+                fields = collections.defaultdict(list)
+                current = ''
@@ -6,7 +6,7 @@ import click
 import sqlalchemy
 import tabulate
 
-from condor.dbutil import requires_db
+from condor.dbutil import find_one, requires_db
 from condor.models import Document
 from condor.models import Bibliography
 
@@ -99,6 +99,13 @@ def delete(database, target):
               help='Try to find full text pdf files in this path.')
 @click.option('--no-cache', is_flag=True,
               help='Do not cache the files for full text.')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(1, None),
+              help='Parse files and extract pdf files with this many processes.')
+@click.option('--timeout', default=None, type=float,
+              help='Give up on pdf files that take longer than this, '
+                   'in seconds.')
+@click.option('--batch-size', default=1000, type=click.IntRange(1, None),
+              help='Write the documents to the database in batches this big.')
 @click.option('--description', '-d', type=str, default=None,
               help='Describe your document set')
 @click.option('--language', '-l', 'languages', multiple=True,
@@ -122,9 +129,7 @@ def create(database, **kwargs):
         click.echo(f'{file_names}')
 
     kwargs['show_progress_bar'] = verbose
-    _bibliography = Bibliography.from_files(**kwargs)
-    database.add(_bibliography)
-    database.flush()
+    _bibliography = Bibliography.ingest(database, **kwargs)
 
     click.echo(f'I\'m writing to {_bibliography.eid}')
     click.echo('And... I\'m done')
@@ -133,5 +138,39 @@ def create(database, **kwargs):
     ))
 
 
+@bibliography.command()
+@click.argument('target')
+@click.argument('kind', type=click.Choice(['xml', 'froac', 'bib', 'isi']))
+@click.argument('files', nargs=-1, type=click.File(lazy=True))
+@click.option('--full-text-path', '-f', 'full_text',
+              type=click.Path(exists=True),
+              help='Try to find full text pdf files in this path.')
+@click.option('--no-cache', is_flag=True,
+              help='Do not cache the files for full text.')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(1, None),
+              help='Parse files and extract pdf files with this many processes.')
+@click.option('--timeout', default=None, type=float,
+              help='Give up on pdf files that take longer than this, '
+                   'in seconds.')
+@click.option('--batch-size', default=1000, type=click.IntRange(1, None),
+              help='Write the documents to the database in batches this big.')
+@click.option('--language', '-l', 'languages', multiple=True,
+              help='Filter specific languages.')
+@requires_db
+def add(database, target, **kwargs):
+    """
+    Adds the records of the given files to an existing bibliography, use
+    `condor matrix update` afterwards to add them to its matrices.
+    """
+    _bibliography = find_one(database, Bibliography, target)
+    added = _bibliography.extend(database, **kwargs)
+
+    click.echo(f'I\'m writing to {_bibliography.eid}')
+    click.echo(f'And... I added {added} records')
+    click.echo('The database contains {} records'.format(
+        Document.count(database, _bibliography.eid)
+    ))
+
+
 if __name__ == "__main__":
     bibliography()
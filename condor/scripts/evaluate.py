@@ -3,12 +3,13 @@ Scripts to evaluate rankins based on ground truth databases.
 """
 
 import collections
+import itertools
 import json
 
 import click
 import numpy
 
-from condor.dbutil import requires_db, find_one
+from condor.dbutil import requires_db, find_one, validate_language
 from condor.models.ranking_matrix import RankingMatrix
 
 
@@ -34,12 +35,19 @@ PerformanceResult = collections.namedtuple(
               help='limit the query by cosine.')
 @click.option('--words', '-w', default=None, type=int,
               help='limit the number of words in the query')
+@click.option('--language', default=None, type=str,
+              callback=validate_language,
+              help='Language of the queries, the dominant language of the '
+                   'documents by default, use auto to guess it per query.')
+@click.option('--batch-size', default=256, type=click.IntRange(1, None),
+              help='Queries to score at once.')
 @click.option('--output', '-o', type=click.File('w'),
               help='export a detailed performance report')
 @click.option('--tabular', '-t', is_flag=True,
               help='show tabular output')
 @requires_db
-def evaluate(db, target, limit, cosine, words, tabular, output):
+def evaluate(db, target, limit, cosine, words, language, batch_size, tabular,
+             output):
     """
     Evaluates a target search engine, the search engine needs to be associated
     to some queries in order to be evaluated, this command mainly returns
@@ -55,11 +63,22 @@ def evaluate(db, target, limit, cosine, words, tabular, output):
 
     performance_results = {}
 
-    for query in queries:
-        if words is not None and len(query.query_string.split()) != words:
-            continue
-        results = ranking_matrix.query(
-            query.query_string.split(), limit=limit, cosine=cosine)
+    queries = [
+        query for query in queries
+        if words is None or len(query.query_string.split()) == words
+    ]
+    all_results = itertools.chain.from_iterable(
+        ranking_matrix.query_many(
+            [
+                query.query_string.split()
+                for query in queries[start:start + batch_size]
+            ],
+            limit=limit, cosine=cosine, language=language,
+        )
+        for start in range(0, len(queries), batch_size)
+    )
+
+    for query, results in zip(queries, all_results):
         experiment = set(r.eid for r, _ in results)
         truth = set(r.document.eid for r in query.results)
         false_negatives = truth.difference(experiment)
@@ -112,6 +131,7 @@ def evaluate(db, target, limit, cosine, words, tabular, output):
                 'queries': len(performance_results),
                 'cosine': cosine,
                 'limit': limit,
+                'language': ranking_matrix.query_language(language),
             },
             'averages': averages,
             'results': {
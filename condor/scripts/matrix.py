@@ -28,10 +28,14 @@ def matrix():
               help='Apply TF-IDF regularisation to the matrix')
 @click.option('--field', '-f', 'fields', multiple=True, type=str, default=None,
               help='Use these fields on matrix creation.')
+@click.option('--sparse/--dense', default=True,
+              help='Store the term document matrix in a sparse format')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(1, None),
+              help='Normalize the documents with this many processes')
 @click.option('--verbose/--quiet', default=False,
               help='Be more verbose')
 @requires_db
-def create(database, target, regularise, fields, verbose):
+def create(database, target, regularise, fields, sparse, jobs, verbose):
     """
     Create a new term document matrix.
     """
@@ -46,7 +50,8 @@ def create(database, target, regularise, fields, verbose):
             bibliography.eid))
 
     td_matrix = TermDocumentMatrix.from_bibliography_set(
-        bibliography, regularise=regularise, fields=fields
+        bibliography, regularise=regularise, fields=fields, sparse=sparse,
+        jobs=jobs,
     )
 
     click.secho('Done!', fg='green')
@@ -54,6 +59,39 @@ def create(database, target, regularise, fields, verbose):
     database.add(td_matrix)
 
 
+@matrix.command()
+@click.option('--target', default=None, type=str,
+              help='Term document matrix to update')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(1, None),
+              help='Normalize the new documents with this many processes')
+@requires_db
+def update(database, target, jobs):
+    """
+    Create a new term document matrix with the documents added to its
+    bibliography, or changed, since it was built.
+    """
+    term_document_matrix = one_or_latest(database, TermDocumentMatrix, target)
+    if term_document_matrix is None:
+        click.echo('Please create a term document matrix first')
+        sys.exit(1)
+
+    try:
+        td_matrix = term_document_matrix.update(jobs=jobs)
+    except ValueError as error:
+        click.secho(str(error), fg='red')
+        sys.exit(1)
+    if td_matrix is None:
+        click.echo('There are no new or changed documents in {}'.format(
+            term_document_matrix.bibliography_eid))
+        return
+
+    database.add(td_matrix)
+    database.flush()
+    click.echo('I\'m writing to {}'.format(td_matrix.eid))
+    click.echo('Create new ranking matrices to search the new documents')
+    click.secho('Done!', fg='green')
+
+
 @matrix.command('list')
 @click.option('--count', default=10, help='Number of bibsets.')
 @requires_db
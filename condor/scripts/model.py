@@ -25,14 +25,32 @@ def model():
               help='Document set to work with')
 @click.option('--regularise', is_flag=True,
               help='Regularise the term document matrix on creation')
+@click.option('--kind', default='lsa', type=click.Choice(RankingMatrix.kinds),
+              help='Kind of ranking matrix to build')
 @click.option('--covariance', default=0.8,
-              help='Default covariance to keep in an lsa model')
+              help='Fraction of the sum of the singular values to keep in '
+                   'an lsa model, of the sum of their squares with the '
+                   'randomized engine')
+@click.option('--rank', '-k', default=None, type=int,
+              help='Keep this many singular values instead of a covariance')
+@click.option('--engine', default='full',
+              type=click.Choice(['full', 'randomized']),
+              help='Singular value decomposition engine for lsa models')
+@click.option('--k1', default=1.2,
+              help='Term frequency saturation of bm25 models')
+@click.option('--b', default=0.75,
+              help='Document length normalization of bm25 models')
 @click.option('--field', '-f', 'fields', multiple=True, type=str, default=None,
               help='Use these fields on matrix creation.')
+@click.option('--sparse/--dense', default=True,
+              help='Store the term document matrix in a sparse format')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(1, None),
+              help='Normalize the documents with this many processes')
 @click.option('--verbose/--quiet', default=False,
               help='Be more verbose')
 @requires_db
-def create(database, target, regularise, covariance, fields, verbose):
+def create(database, target, regularise, kind, covariance, rank, engine,
+           k1, b, fields, sparse, jobs, verbose):
     """
     Creates a ranking matrix and a lsa model for the specified bibliography.
     """
@@ -46,14 +64,20 @@ def create(database, target, regularise, covariance, fields, verbose):
             bibliography.eid))
 
     td_matrix = TermDocumentMatrix.from_bibliography_set(
-        bibliography, regularise=regularise, fields=fields
+        bibliography, regularise=regularise, fields=fields, sparse=sparse,
+        jobs=jobs,
     )
     database.add(td_matrix)
     database.flush()
 
-    ranking_matrix = RankingMatrix.lsa_from_term_document_matrix(
+    ranking_matrix = RankingMatrix.from_term_document_matrix(
         term_document_matrix=td_matrix,
+        kind=kind,
         covariance=covariance,
+        rank=rank,
+        engine=engine,
+        k1=k1,
+        b=b,
     )
     database.add(ranking_matrix)
     click.secho('Done!', fg='green')
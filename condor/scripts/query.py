@@ -3,16 +3,20 @@ Uses the latest model to query the database for the most important documents
 according to lsa.
 """
 
+import itertools
+import json
 import sys
 
 import click
 
-from condor.dbutil import requires_db, one_or_latest
+from condor.dbutil import requires_db, one_or_latest, validate_language
 from condor.models import RankingMatrix
+from condor.normalize import warmup
+from condor.util import LanguageGuesser
 
 
 @click.command()
-@click.argument('parameters', nargs=-1, required=True)
+@click.argument('parameters', nargs=-1)
 @click.option('--target', default=None, type=str,
               help='Ranking matrix to search')
 @click.option('--limit', '-l', default=None, type=int,
@@ -21,28 +25,54 @@ from condor.models import RankingMatrix
               help='Max cosine to show.')
 @click.option('--show', '-s', type=str, multiple=True,
               help='Fields to show.')
+@click.option('--language', default=None, type=str,
+              callback=validate_language,
+              help='Language of the queries, the dominant language of the '
+                   'documents by default, use auto to guess it per query.')
+@click.option('--batch', '-b', type=click.File('r'), default=None,
+              help='Read one query per line from this file, use - for stdin.')
+@click.option('--batch-size', default=256, type=click.IntRange(1, None),
+              help='Queries to score at once in batch mode.')
 @click.option('--verbose/--quiet', default=False,
               help='Be more verbose')
 @requires_db
-def query(database, parameters, limit, cosine, target, show, verbose):
+def query(database, parameters, limit, cosine, target, show, language,
+          batch, batch_size, verbose):
     """
     Queries the database using the given parameters, the model that this
     script will pick up to do the query is the latest available model.
+
+    In batch mode the queries are read from a file, one per line, and the
+    results are written as JSON lines.
     """
 
-    if verbose:
+    if not parameters and batch is None:
+        raise click.UsageError('Missing the query parameters or a batch file.')
+
+    if verbose and batch is None:
         click.echo('You queried: {}'.format(' '.join(parameters)))
 
     ranking_matrix = one_or_latest(database, RankingMatrix, target)
 
     if ranking_matrix is None:
-        click.echo('Please create a ranking first')
+        click.echo('Please create a ranking first', err=batch is not None)
         sys.exit(1)
 
+    if batch is not None:
+        query_language = ranking_matrix.query_language(language)
+        if query_language is None:
+            warmup(LanguageGuesser.languages())
+        else:
+            warmup([query_language])
+        query_batch(ranking_matrix, batch, batch_size,
+                    limit=limit, cosine=cosine, show=show, language=language)
+        return
+
     click.echo('I will query the ranking for the {} ranking...'.format(
         ranking_matrix.eid))
 
-    results = ranking_matrix.query(parameters, limit=limit, cosine=cosine)
+    results = ranking_matrix.query(parameters, limit=limit, cosine=cosine,
+                                   language=language)
 
     if not results:
         click.echo('No result found for: {}'.format(' '.join(parameters)))
@@ -57,3 +87,44 @@ def query(database, parameters, limit, cosine, target, show, verbose):
                 click.echo(getattr(document, field))
             except AttributeError:
                 pass
+
+
+def query_batch(ranking_matrix, lines, batch_size, limit=None, cosine=None,
+                show=(), language=None):
+    """
+    Queries a ranking matrix with one query per line and writes the results
+    as JSON lines as soon as each batch of queries is scored.
+
+    :param ranking_matrix: ranking matrix to search
+    :param lines: iterable of query strings
+    :param batch_size: queries to score at once
+    :param limit: limit of documents to use
+    :param cosine: limit cosine to use
+    :param show: document fields to include in the results
+    :param language: language of the queries
+    """
+    queries = (line.strip() for line in lines)
+    queries = (query_string for query_string in queries if query_string)
+    while True:
+        chunk = list(itertools.islice(queries, batch_size))
+        if not chunk:
+            break
+        results = ranking_matrix.query_many(
+            [query_string.split() for query_string in chunk],
+            limit=limit, cosine=cosine, language=language,
+        )
+        for query_string, documents in zip(chunk, results):
+            click.echo(json.dumps({
+                'query': query_string,
+                'results': [
+                    dict(
+                        {
+                            field: getattr(document, field, None)
+                            for field in ('title', ) + tuple(show)
+                        },
+                        eid=document.eid,
+                        score=float(score),
+                    )
+                    for document, score in documents
+                ],
+            }, default=str))
@@ -23,12 +23,26 @@ def ranking():
 @ranking.command()
 @click.option('--target', default=None, type=str,
               help='Document set to work with')
+@click.option('--kind', default='lsa', type=click.Choice(RankingMatrix.kinds),
+              help='Kind of ranking matrix to build')
 @click.option('--covariance', default=0.8,
-              help='Default covariance to keep in an lsa model')
+              help='Fraction of the sum of the singular values to keep in '
+                   'an lsa model, of the sum of their squares with the '
+                   'randomized engine')
+@click.option('--rank', '-k', default=None, type=int,
+              help='Keep this many singular values instead of a covariance')
+@click.option('--engine', default='full',
+              type=click.Choice(['full', 'randomized']),
+              help='Singular value decomposition engine for lsa models')
+@click.option('--k1', default=1.2,
+              help='Term frequency saturation of bm25 models')
+@click.option('--b', default=0.75,
+              help='Document length normalization of bm25 models')
 @click.option('--verbose/--quiet', default=False,
               help='Be more verbose')
 @requires_db
-def create(database, target, covariance, verbose):
+def create(database, target, kind, covariance, rank, engine, k1, b,
+           verbose):
     """
     Create a new term document matrix.
     """
@@ -44,9 +58,14 @@ def create(database, target, covariance, verbose):
             )
         )
 
-    ranking_matrix = RankingMatrix.lsa_from_term_document_matrix(
+    ranking_matrix = RankingMatrix.from_term_document_matrix(
         term_document_matrix=td_matrix,
+        kind=kind,
         covariance=covariance,
+        rank=rank,
+        engine=engine,
+        k1=k1,
+        b=b,
     )
     database.add(ranking_matrix)
 
@@ -66,6 +85,7 @@ def list_ranking_matrices(database, count):
             [
                 [
                     rm.eid[:8],
+                    rm.kind,
                     rm.term_document_matrix.eid[:8],
                     rm.created.strftime('%b %d, %Y, %I:%M%p'),
                     rm.modified.strftime('%b %d, %Y, %I:%M%p'),
@@ -74,6 +94,7 @@ def list_ranking_matrices(database, count):
             ],
             headers=[
                 'Identifier',
+                'Kind',
                 'Term document matrix',
                 'Created at',
                 'Updated at'
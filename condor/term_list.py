@@ -0,0 +1,123 @@
+"""
+A compact binary format for sorted vocabularies, term lists are memory
+mapped read only so many processes can share them and terms are looked up
+with a binary search instead of loading every term in a python list.
+
+The file holds a header with a magic string and the number of terms, the
+offsets of every term as little endian unsigned 64 bit integers and the UTF-8
+encoded terms one after the other.
+"""
+
+import mmap
+import os
+import struct
+
+import numpy
+
+
+MAGIC = b'CTL1'
+HEADER = struct.Struct('<4s4xQ')
+
+
+class TermList(object):
+    """
+    Read only view over a binary term list file.
+
+    :param path: path of the term list file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._buffer = mmap.mmap(handle.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC:
+            raise ValueError('{} is not a term list file'.format(path))
+        self._offsets = numpy.frombuffer(
+            self._buffer, dtype='<u8', count=count + 1, offset=HEADER.size
+        )
+        self._start = HEADER.size + self._offsets.nbytes
+
+    @staticmethod
+    def write(path, words):
+        """
+        Stores a sorted vocabulary in a term list file.
+
+        :param path: path of the term list file
+        :param words: sorted list of unique terms
+        """
+        encoded = [word.encode('utf-8') for word in words]
+        if any(a >= b for a, b in zip(encoded, encoded[1:])):
+            raise ValueError('Term lists need sorted unique terms')
+        offsets = numpy.zeros(len(encoded) + 1, dtype='<u8')
+        numpy.cumsum([len(term) for term in encoded], out=offsets[1:])
+        partial_path = path + '.partial'
+        with open(partial_path, 'wb') as handle:
+            handle.write(HEADER.pack(MAGIC, len(encoded)))
+            handle.write(offsets.tobytes())
+            handle.write(b''.join(encoded))
+        os.replace(partial_path, path)
+
+    def close(self):
+        """
+        Unmaps the file, the term list can not be used afterwards.
+        """
+        self._offsets = None
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the term list outside of the OS page cache.
+        """
+        return 0
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _term(self, position):
+        return self._buffer[
+            self._start + int(self._offsets[position]):
+            self._start + int(self._offsets[position + 1])
+        ]
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('term list index out of range')
+        return self._term(position).decode('utf-8')
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._term(position).decode('utf-8')
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def get(self, term, default=None):
+        """
+        Finds the position of a term with a binary search.
+
+        :param term: term to look for
+        :param default: value to return for unknown terms
+        :return: the position of the term or the default
+        """
+        encoded = term.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self._term(low) == encoded:
+            return low
+        return default
@@ -5,15 +5,18 @@ to work with XML, lists and generators.
 
 import collections
 import functools
+import hashlib
 import re
 from collections import OrderedDict
 
 import PyPDF2
 import langdetect
 import langcodes
+import numpy
+from langdetect.lang_detect_exception import LangDetectException
 
-from condor.normalize import PunctuationRemover, CompleteNormalizer
-from condor.normalize import SpaceTokenizer
+from condor.normalize import PunctuationRemover
+from condor.normalize import SpaceTokenizer, get_normalizer, stopword_set
 
 
 def xml_to_text(func):
@@ -78,40 +81,140 @@ class LanguageGuesser(object):
     """
 
     default_lang = 'english'
+    codes = ['es', 'en', 'pt', 'fr', 'it', 'de']
+    cache_size = 2 ** 16
+
+    _stopword_sets = None
 
     def __init__(self):
         langdetect.DetectorFactory.seed = 139
-        langdetect.DetectorFactory.langlist = [
-            'es', 'en', 'pt', 'fr', 'it', 'de'
+        langdetect.DetectorFactory.langlist = self.codes
+        self._cache = OrderedDict()
+
+    @classmethod
+    def languages(cls):
+        """
+        Names of the languages the guesser was set up for.
+        """
+        return [
+            langcodes.get(code).language_name('en').lower()
+            for code in cls.codes
         ]
 
     def counts(self, sentence):
         raise NotImplementedError("Not required anymore")
 
     def guess(self, sentence):
-        result = langdetect.detect_langs(sentence)[0]
+        """
+        Guesses the language of a sentence.
+
+        :param str sentence: text to look at
+        :return: the english name of the language, in lowercase
+        """
+        return self.guess_many([sentence])[0]
+
+    def guess_many(self, sentences):
+        """
+        Guesses the language of many sentences.
+
+        Guesses are cached by the digest of the sentence. Sentences with
+        clearly more stopwords of one language than of any other are
+        settled without running langdetect.
+
+        :param list sentences: texts to look at
+        :return: list of language names, one per sentence
+        """
+        guesses = []
+        for sentence in sentences:
+            key = hashlib.sha1(sentence.encode('utf-8')).digest()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                guesses.append(self._cache[key])
+                continue
+            language = self._stopword_guess(sentence)
+            if language is None:
+                language = self._detect(sentence)
+            self._cache[key] = language
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            guesses.append(language)
+        return guesses
+
+    def _stopword_guess(self, sentence):
+        tokens = re.findall(r'\w+', sentence.lower())
+        hits = sorted(
+            (sum(token in stopwords for token in tokens), language)
+            for language, stopwords in self._stopwords().items()
+        )
+        if not hits:
+            return None
+        best, language = hits[-1]
+        runner_up = hits[-2][0] if len(hits) > 1 else 0
+        if best >= 2 and best > 2 * runner_up:
+            return language
+        return None
+
+    @classmethod
+    def _stopwords(cls):
+        if cls._stopword_sets is None:
+            stopword_sets = {}
+            for language in cls.languages():
+                try:
+                    stopword_sets[language] = stopword_set(language)
+                except LookupError:
+                    pass
+            cls._stopword_sets = stopword_sets
+        return cls._stopword_sets
+
+    def _detect(self, sentence):
+        try:
+            result = langdetect.detect_langs(sentence)[0]
+        except LangDetectException:
+            return self.default_lang
         code = result.lang if result.prob > 0.3 else 'en'
         language = langcodes.get(code)
         return language.language_name('en').lower()
 
 
-def frequency(words, tokens):
+@functools.lru_cache(maxsize=None)
+def language_guesser():
     """
-    Computes the frequency list of a list of tokens in a dense representation.
+    Language guesser shared by the whole process, along with its cache.
+    """
+    return LanguageGuesser()
+
 
-    :param list words: list of the words to look for
+def encode_query(term_index, tokens, language=None, normalizer_class=None):
+    """
+    Computes the frequency of a list of tokens as a sparse vector, only the
+    terms in the vocabulary are looked up.
+
+    :param term_index: column of every term of the vocabulary, a dict or a
+        `condor.term_list.TermList`
     :param list tokens: list of the tokens to count
+    :param str language: language of the tokens, guessed if missing
+    :param normalizer_class: normalizer class, `CompleteNormalizer` by default
+    :return: a tuple of arrays `(columns, counts)` sorted by column
 
-    .. note:: this function applies a complete normalizer to the given tokens and guesses the language.
+    .. note:: this function normalizes the given tokens.
     """
-    # word_dict = {word: pos for pos, word in enumerate(words)}
-    language = LanguageGuesser().guess(' '.join(tokens))
-    normalizer = CompleteNormalizer(language=language)
+    if language is None:
+        language = language_guesser().guess(' '.join(tokens))
+    normalizer = get_normalizer(normalizer_class, language)
     counts = collections.Counter(
         normalizer.apply_to(token)
         for token in tokens
     )
-    return [counts.get(word, 0) for word in words]
+    found = sorted(
+        (column, count)
+        for column, count in (
+            (term_index.get(term), count) for term, count in counts.items()
+        )
+        if column is not None
+    )
+    columns = numpy.array([column for column, _ in found], dtype=numpy.int64)
+    values = numpy.array([count for _, count in found], dtype=float)
+    return columns, values
 
 
 def full_text_from_pdf(filename):
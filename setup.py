@@ -14,6 +14,7 @@ def install_requires():
         "click~=6.7",
         "nltk~=3.4",
         "numpy~=1.17",
+        "scipy~=1.3",
         "langdetect",
         "langcodes",
         "PyPDF2~=1.26",
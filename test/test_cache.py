@@ -0,0 +1,86 @@
+import os
+from types import SimpleNamespace
+
+import numpy
+import scipy.sparse
+import pytest
+
+from condor.cache import CachedRanking, RankingCache
+
+
+class FakeRanking(object):
+
+    def __init__(self, eid, directory, rows=4):
+        self.eid = eid
+        self.rows = rows
+        self.loads = 0
+        self.ranking_matrix_path = str(directory.join(eid + '.npy'))
+        term_list_path = str(directory.join(eid + '.txt'))
+        for path in (self.ranking_matrix_path, term_list_path):
+            with open(path, 'w') as handle:
+                handle.write(eid)
+        self.term_document_matrix = SimpleNamespace(
+            term_list_path=term_list_path
+        )
+
+    def load_cached_ranking(self):
+        self.loads += 1
+        return CachedRanking(
+            numpy.ones((self.rows, 2)), {'alpha': 0, 'beta': 1}
+        )
+
+
+@pytest.fixture
+def cache():
+    return RankingCache()
+
+
+def test_cache_loads_rankings_once(cache, tmpdir):
+    ranking = FakeRanking('first', tmpdir)
+    assert cache.get(ranking) is cache.get(ranking)
+    assert ranking.loads == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_cache_reloads_modified_rankings(cache, tmpdir):
+    ranking = FakeRanking('first', tmpdir)
+    cache.get(ranking)
+    stat = os.stat(ranking.ranking_matrix_path)
+    os.utime(ranking.ranking_matrix_path,
+             (stat.st_atime, stat.st_mtime + 10))
+    cache.get(ranking)
+    assert ranking.loads == 2
+
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    first = FakeRanking('first', tmpdir, rows=1000)
+    second = FakeRanking('second', tmpdir, rows=1000)
+    cache = RankingCache(max_bytes=first.load_cached_ranking().nbytes + 1)
+    cache.get(first)
+    cache.get(second)
+    cache.get(first)
+    assert first.loads == 3
+    assert second.loads == 1
+
+
+def test_cached_ranking_computes_cosines():
+    cached = CachedRanking(numpy.array([[1.0, 0.0], [1.0, 1.0]]), {})
+    cosines = cached.cosines(numpy.array([1.0, 0.0]))
+    assert numpy.allclose(cosines, [1.0, 1.0 / numpy.sqrt(2)])
+
+
+def test_cached_ranking_scores_sparse_queries_like_dense_ones():
+    random = numpy.random.RandomState(3)
+    vectors = random.normal(size=(6, 5))
+    projection = random.normal(size=(5, 8))
+    freqs = numpy.array([
+        [0, 2, 0, 0, 1, 0, 0, 0],
+        [1, 0, 0, 0, 0, 0, 0, 3],
+    ], dtype=float)
+    cached = CachedRanking(vectors, {}, projection=projection)
+    expected = numpy.dot(vectors, numpy.dot(projection, freqs.T)) / \
+        numpy.outer(cached.norms, numpy.linalg.norm(freqs, axis=1))
+    sparse = scipy.sparse.csr_matrix(freqs)
+    assert numpy.allclose(cached.cosines_many(sparse), expected)
+    assert numpy.allclose(cached.cosines_many(freqs), expected)
@@ -0,0 +1,98 @@
+import json
+import os
+import time
+
+import pytest
+
+from condor import full_text
+from condor.full_text import EXTRACTOR_VERSION, FullTextCache, file_digest
+from condor.models import Document
+
+
+@pytest.fixture(autouse=True)
+def extractor(monkeypatch):
+    monkeypatch.setattr(full_text, 'full_text_from_pdf',
+                        lambda path: 'text of ' + os.path.basename(path))
+
+
+def write(path, content):
+    with open(path, 'wb') as handle:
+        handle.write(content)
+    return path
+
+
+def test_identical_pdfs_are_extracted_once(tmpdir):
+    first = write(str(tmpdir.join('first.pdf')), b'not really a pdf')
+    second = write(str(tmpdir.join('second.pdf')), b'not really a pdf')
+    cache = FullTextCache(directory=str(tmpdir))
+    texts = cache.extract_many([first, second])
+    assert texts[first] == texts[second]
+    assert texts[first] == cache.text_path(file_digest(first))
+    with open(cache.manifest_path) as manifest:
+        assert json.load(manifest) == {file_digest(first): EXTRACTOR_VERSION}
+
+
+def test_stale_texts_are_extracted_again(tmpdir):
+    pdf = write(str(tmpdir.join('file.pdf')), b'not really a pdf')
+    cache = FullTextCache(directory=str(tmpdir))
+    cache.manifest[file_digest(pdf)] = EXTRACTOR_VERSION - 1
+    assert cache.extract_many([pdf], jobs=2, timeout=30) == {
+        pdf: cache.text_path(file_digest(pdf))
+    }
+    assert os.path.exists(cache.text_path(file_digest(pdf)))
+    assert FullTextCache(directory=str(tmpdir)).is_fresh(file_digest(pdf))
+
+
+def test_slow_pdfs_are_given_up(tmpdir, monkeypatch):
+    monkeypatch.setattr(full_text, 'full_text_from_pdf',
+                        lambda path: time.sleep(30))
+    pdf = write(str(tmpdir.join('slow.pdf')), b'a very slow pdf')
+    cache = FullTextCache(directory=str(tmpdir))
+    assert cache.extract_many([pdf], timeout=0.2) == {}
+    assert sorted(os.listdir(str(tmpdir))) == ['manifest.json', 'slow.pdf']
+    assert not cache.is_fresh(file_digest(pdf))
+
+
+def test_slow_pdfs_do_not_hold_back_the_others(tmpdir, monkeypatch):
+    def extract(path):
+        if path.endswith('slow.pdf'):
+            time.sleep(30)
+        return 'text of ' + os.path.basename(path)
+
+    monkeypatch.setattr(full_text, 'full_text_from_pdf', extract)
+    slow = write(str(tmpdir.join('slow.pdf')), b'a very slow pdf')
+    fast = [
+        write(str(tmpdir.join('fast{}.pdf'.format(i))), b'pdf %d' % i)
+        for i in range(4)
+    ]
+    cache = FullTextCache(directory=str(tmpdir))
+    texts = cache.extract_many([slow] + fast, jobs=2, timeout=0.5)
+    assert sorted(texts) == sorted(fast)
+    assert not os.path.exists(cache.text_path(file_digest(slow)) + '.partial')
+
+
+def test_records_without_a_file_have_no_full_text(monkeypatch, tmpdir):
+    monkeypatch.setattr('condor.models.document.FULL_TEXT_PATH', str(tmpdir))
+    write(str(tmpdir.join('record.txt')), b'text cached by hash')
+    assert Document.load_full_texts([{'hash': 'record'}], {}) == [None]
+    assert Document.load_full_texts(
+        [{'hash': 'record', 'file': ':missing.pdf:PDF'}], {}
+    ) == [str(tmpdir.join('record.txt'))]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_broken_pdfs_are_skipped_with_a_warning(tmpdir, monkeypatch, jobs):
+    def extract(path):
+        if path.endswith('broken.pdf'):
+            raise ValueError('not a pdf')
+        return 'text of ' + os.path.basename(path)
+
+    monkeypatch.setattr(full_text, 'full_text_from_pdf', extract)
+    broken = write(str(tmpdir.join('broken.pdf')), b'broken')
+    fine = write(str(tmpdir.join('fine.pdf')), b'fine')
+    cache = FullTextCache(directory=str(tmpdir))
+    with pytest.warns(UserWarning, match='broken.pdf'):
+        texts = cache.extract_many([broken, fine], jobs=jobs)
+    assert list(texts) == [fine]
+    assert not os.path.exists(cache.text_path(file_digest(broken)) +
+                              '.partial')
@@ -0,0 +1,67 @@
+import numpy
+import pytest
+import scipy.sparse
+
+from condor.index import InvertedIndex
+
+
+@pytest.fixture(scope='module')
+def counts():
+    random = numpy.random.RandomState(11)
+    dense = random.poisson(0.3, size=(200, 50))
+    dense[:, 7] = 0
+    return scipy.sparse.csr_matrix(dense)
+
+
+def brute_force(index, terms, weights):
+    scores = numpy.zeros(len(index.lengths))
+    for term, weight in zip(terms, weights):
+        documents, impacts = index.postings(term)
+        scores[documents] += weight * impacts
+    return scores
+
+
+@pytest.mark.parametrize('limit', [1, 5, 30, 500])
+def test_search_matches_brute_force(counts, limit):
+    index = InvertedIndex.from_counts(counts)
+    terms, weights = [3, 7, 12, 40, 41], [1, 2, 1, 1, 3]
+    scores = brute_force(index, terms, weights)
+    documents, found = index.search(terms, weights, limit=limit)
+    expected = numpy.sort(scores[scores > 0])[::-1][:limit]
+    assert numpy.allclose(found, expected)
+    assert numpy.allclose(scores[documents], found)
+
+
+def test_search_with_a_threshold(counts):
+    index = InvertedIndex.from_counts(counts)
+    scores = brute_force(index, [1, 2], [1, 1])
+    documents, found = index.search([1, 2], threshold=2.0)
+    assert set(documents) == set(numpy.flatnonzero(scores > 2.0))
+
+
+def test_search_only_scores_documents_in_the_postings(counts, monkeypatch):
+    index = InvertedIndex.from_counts(counts)
+    terms = [3, 12]
+    touched = set()
+    for term in terms:
+        touched.update(index.postings(term)[0])
+    sizes = []
+    bar = InvertedIndex._bar
+
+    def recording_bar(scores, limit, threshold):
+        sizes.append(len(scores))
+        return bar(scores, limit, threshold)
+
+    monkeypatch.setattr(InvertedIndex, '_bar', staticmethod(recording_bar))
+    index.search(terms, limit=5)
+    assert max(sizes) == len(touched) < len(index.lengths)
+
+
+def test_indices_survive_a_round_trip(counts, tmpdir):
+    index = InvertedIndex.from_counts(counts, k1=1.5, b=0.5)
+    path = str(tmpdir.join('index.npz'))
+    index.save(path)
+    loaded = InvertedIndex.load(path)
+    assert (loaded.k1, loaded.b) == (1.5, 0.5)
+    assert numpy.array_equal(loaded.documents, index.documents)
+    assert numpy.allclose(loaded.impacts, index.impacts)
@@ -39,3 +39,29 @@ def test_language_guesser_preferences(guesser):
     assert 'english' == guesser.guess(
         'Communications in Computer and Information Science'
     )
+
+
+def test_language_guesser_caches_guesses(monkeypatch):
+    guesser = LanguageGuesser()
+    result = Mock(lang='fr', prob=0.9)
+    detect = Mock(return_value=[result])
+    monkeypatch.setattr('langdetect.detect_langs', detect)
+    monkeypatch.setattr(LanguageGuesser, '_stopword_sets', {})
+    assert guesser.guess_many(['bonjour', 'salut', 'bonjour']) == [
+        'french', 'french', 'french'
+    ]
+    assert detect.call_count == 2
+
+
+def test_language_guesser_settles_clear_stopword_majorities(monkeypatch):
+    guesser = LanguageGuesser()
+    detect = Mock(side_effect=AssertionError('langdetect was used'))
+    monkeypatch.setattr('langdetect.detect_langs', detect)
+    monkeypatch.setattr(LanguageGuesser, '_stopword_sets', {
+        'english': frozenset(['the', 'of', 'and']),
+        'spanish': frozenset(['el', 'de', 'y']),
+    })
+    assert guesser.guess('the history of rome and greece') == 'english'
+    detect.side_effect = None
+    detect.return_value = [Mock(lang='es', prob=0.9)]
+    assert guesser.guess('the history of el imperio') == 'spanish'
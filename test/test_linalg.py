@@ -0,0 +1,53 @@
+import numpy
+import pytest
+import scipy.sparse
+
+from condor.linalg import randomized_svd, truncated_svd
+from condor.models import RankingMatrix
+
+
+@pytest.fixture(scope='module')
+def matrix():
+    random = numpy.random.RandomState(7)
+    left = random.normal(size=(60, 8))
+    right = random.normal(size=(8, 40))
+    return left @ right
+
+
+def test_randomized_svd_finds_leading_singular_values(matrix):
+    _, expected, _ = numpy.linalg.svd(matrix, full_matrices=False)
+    u, s, v = randomized_svd(matrix, 5)
+    assert u.shape == (60, 5)
+    assert v.shape == (5, 40)
+    assert numpy.allclose(s, expected[:5])
+
+
+def test_randomized_svd_works_on_sparse_matrices(matrix):
+    dense = randomized_svd(matrix, 5)[1]
+    sparse = randomized_svd(scipy.sparse.csr_matrix(matrix), 5)[1]
+    assert numpy.allclose(dense, sparse)
+
+
+def test_truncated_svd_keeps_the_requested_covariance(matrix):
+    u, s, v = truncated_svd(matrix, covariance=0.9, step=2)
+    _, expected, _ = numpy.linalg.svd(matrix, full_matrices=False)
+    explained = numpy.cumsum(expected ** 2) / numpy.sum(expected ** 2)
+    assert len(s) == numpy.sum(explained < 0.9)
+    assert numpy.allclose(s, expected[:len(s)])
+    assert u.shape[1] == len(s) == v.shape[0]
+
+
+def test_truncated_svd_requires_a_target(matrix):
+    with pytest.raises(ValueError):
+        truncated_svd(matrix)
+
+
+@pytest.mark.parametrize('covariance', [0.5, 0.8, 0.95])
+def test_full_svd_engine_keeps_a_fraction_of_the_singular_values(
+        matrix, covariance):
+    _, expected, _ = numpy.linalg.svd(matrix, full_matrices=False)
+    _, s, _ = RankingMatrix._svd(matrix, covariance=covariance,
+                                 engine='full')
+    rank = numpy.sum(numpy.cumsum(expected) / numpy.sum(expected) <
+                     covariance)
+    assert len(s) == rank
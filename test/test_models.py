@@ -1,3 +1,6 @@
+import os
+
+import numpy
 import pytest
 
 from condor.dbutil import session as Session
@@ -7,6 +10,7 @@ from condor.models import (
     TermDocumentMatrix,
     RankingMatrix,
 )
+from condor.normalize import CompleteNormalizer, Lowercaser
 
 
 @pytest.yield_fixture(scope='function')
@@ -98,3 +102,274 @@ def test_engines_are_deleted(session, bibset):
     assert session.query(RankingMatrix).filter(
         RankingMatrix.eid == rank_eid
     ).first() is None
+
+
+@pytest.fixture
+def documents(session, bibset):
+    texts = [
+        ('Latent semantic analysis', 'Searching documents with matrices'),
+        ('Sparse matrices', 'Storing matrices that are mostly zeros'),
+        ('Stemming words', 'Normalizing words before searching them'),
+    ]
+    for title, description in texts:
+        session.add(Document(
+            bibliography_eid=bibset.eid,
+            hash=title,
+            title=title,
+            description=description,
+            keywords='',
+            language='english',
+        ))
+    session.flush()
+    session.refresh(bibset)
+    return bibset.documents
+
+
+@pytest.mark.parametrize('regularise', [True, False])
+def test_sparse_and_dense_matrices_match(bibset, documents, regularise):
+    sparse = TermDocumentMatrix.from_bibliography_set(
+        bibset, regularise=regularise, sparse=True
+    )
+    dense = TermDocumentMatrix.from_bibliography_set(
+        bibset, regularise=regularise, sparse=False
+    )
+    assert sparse.is_sparse
+    assert not dense.is_sparse
+    assert sparse.words == dense.words
+    assert numpy.allclose(sparse.matrix.toarray(), dense.matrix)
+
+
+def test_factored_lsa_scores_like_lsa(session, bibset, documents):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(bibset)
+    session.add(term_matrix)
+    session.flush()
+    lsa = RankingMatrix.from_term_document_matrix(
+        term_matrix, kind='lsa', covariance=0.9
+    )
+    factored = RankingMatrix.from_term_document_matrix(
+        term_matrix, kind='factored-lsa', covariance=0.9
+    )
+    session.add_all([lsa, factored])
+    session.flush()
+    expected = lsa.query(['matrices', 'searching'])
+    result = factored.query(['matrices', 'searching'])
+    assert [d.eid for d, _ in expected] == [d.eid for d, _ in result]
+    assert numpy.allclose([c for _, c in expected], [c for _, c in result])
+
+
+def test_dense_matrices_are_memory_mapped(bibset, documents):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(
+        bibset, sparse=False
+    )
+    assert isinstance(term_matrix.matrix, numpy.memmap)
+    assert not term_matrix.matrix.flags.writeable
+    pinned = term_matrix.load_matrix(pin=True)
+    assert not isinstance(pinned, numpy.memmap)
+    assert numpy.allclose(pinned, term_matrix.matrix)
+
+
+def test_ranking_selection_keeps_the_best_rows_in_order():
+    cos = numpy.array([0.1, 0.9, numpy.nan, 0.5, 0.7])
+    assert list(RankingMatrix._select(cos, limit=2)) == [1, 4]
+    assert list(RankingMatrix._select(cos, cosine=0.3)) == [1, 4, 3]
+    assert list(RankingMatrix._select(cos, limit=10))[:4] == [1, 4, 3, 0]
+
+
+def test_queries_return_documents_in_the_matrix_order(session, bibset,
+                                                      documents):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(bibset)
+    session.add(term_matrix)
+    session.flush()
+    assert term_matrix.document_eids == [d.eid for d in documents]
+    ranking = RankingMatrix.from_term_document_matrix(term_matrix, rank=3)
+    session.add(ranking)
+    session.flush()
+    results = ranking.query(['sparse', 'matrices'], limit=1)
+    assert [d.title for d, _ in results] == ['Sparse matrices']
+
+
+def test_query_many_matches_single_queries(session, bibset, documents):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(bibset)
+    session.add(term_matrix)
+    session.flush()
+    ranking = RankingMatrix.from_term_document_matrix(term_matrix, rank=3)
+    session.add(ranking)
+    session.flush()
+    queries = [
+        ['sparse', 'matrices'],
+        ['the', 'weather', 'is', 'nice', 'today'],
+        ['searching', 'documents'],
+    ]
+    batched = ranking.query_many(queries, limit=2)
+    assert batched[1] == []
+    for tokens, results in zip(queries, batched):
+        single = ranking.query(tokens, limit=2)
+        assert [d.eid for d, _ in results] == [d.eid for d, _ in single]
+        assert numpy.allclose([c for _, c in results], [c for _, c in single])
+
+
+@pytest.mark.parametrize('regularise', [True, False])
+def test_bm25_rankings_use_raw_counts(session, bibset, documents, regularise):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(
+        bibset, regularise=regularise
+    )
+    session.add(term_matrix)
+    session.flush()
+    ranking = RankingMatrix.from_term_document_matrix(term_matrix,
+                                                      kind='bm25')
+    session.add(ranking)
+    session.flush()
+    assert ranking.kind == 'bm25'
+    assert ranking.index.documents.dtype == numpy.int64
+    results = ranking.query(['sparse', 'matrices'], limit=2)
+    assert [d.title for d, _ in results][0] == 'Sparse matrices'
+    assert ranking.query_many([['the', 'weather', 'is', 'nice', 'today']]) \
+        == [[]]
+
+
+def test_one_pass_counts_match_the_two_pass_matrix(bibset, documents):
+    fields = ['title', 'description', 'keywords']
+    words, counts = TermDocumentMatrix._count(documents, fields,
+                                              CompleteNormalizer)
+    assert words == bibset.words(fields, CompleteNormalizer)
+    expected = numpy.zeros(counts.shape, dtype=int)
+    for row, col, freq in TermDocumentMatrix._matrix(words, documents, fields,
+                                                     CompleteNormalizer):
+        expected[row, col] = freq
+    assert numpy.array_equal(counts.toarray(), expected)
+
+
+def test_parallel_counts_match_serial_counts(documents):
+    fields = ['title', 'description', 'keywords']
+    serial = TermDocumentMatrix._count(documents, fields, CompleteNormalizer)
+    parallel = TermDocumentMatrix._count(documents, fields,
+                                         CompleteNormalizer, jobs=2)
+    assert serial[0] == parallel[0]
+    assert numpy.array_equal(serial[1].toarray(), parallel[1].toarray())
+
+
+def test_ingestion_overwrites_duplicates_across_batches(session):
+    with open('data/bib/oaa.bib') as first, open('data/bib/oaa.bib') as second:
+        bibliography = Bibliography.ingest(session, 'bib', [first, second],
+                                           batch_size=2)
+    stored = Document.list(session, bibliography.eid)
+    assert len(stored) == 3
+    assert len({document.hash for document in stored}) == 3
+
+
+def test_parallel_parsing_matches_serial_parsing():
+    def mappings(jobs):
+        with open('data/bib/oaa.bib') as first, \
+                open('data/bib/oaa.bib') as second:
+            return Document.mappings_from_files('bib', [first, second],
+                                                jobs=jobs)
+    assert mappings(jobs=2) == mappings(jobs=1)
+
+
+def test_single_bibtex_files_are_parsed_with_the_jobs():
+    with open('data/bib/oaa.bib') as file:
+        records = Document._iter_file_records('bib', [file], jobs=2)
+        iterator = next(records)
+        assert iterator.jobs == 2
+        parsed = list(iterator)
+    with open('data/bib/oaa.bib') as file:
+        assert parsed == list(next(Document._iter_file_records('bib', [file])))
+
+
+def test_queries_use_the_dominant_language(session, bibset, documents,
+                                           monkeypatch):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(bibset)
+    session.add(term_matrix)
+    session.flush()
+    assert term_matrix.language == 'english'
+    ranking = RankingMatrix.from_term_document_matrix(term_matrix, rank=3)
+    session.add(ranking)
+    session.flush()
+
+    def no_guessing():
+        raise AssertionError('the language was guessed')
+
+    monkeypatch.setattr('condor.util.language_guesser', no_guessing)
+    results = ranking.query(['sparse', 'matrices'], limit=1)
+    assert [d.title for d, _ in results] == ['Sparse matrices']
+    assert [d.title for d, _ in ranking.query(['stemming'], limit=1)] == \
+        ['Stemming words']
+    assert ranking.query(['stemming'], language='spanish') == []
+    with pytest.raises(AssertionError):
+        ranking.query(['sparse'], language='auto')
+
+
+def test_term_lists_are_stored_in_the_binary_format(bibset, documents):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(bibset)
+    assert term_matrix.term_list_path.endswith('.terms')
+    term_index = term_matrix.term_index
+    assert [term_index.get(word) for word in term_matrix.words] == \
+        list(range(term_matrix.matrix.shape[1]))
+    assert term_matrix.term_index is term_index
+
+
+@pytest.mark.parametrize('sparse', [True, False])
+@pytest.mark.parametrize('regularise', [True, False])
+def test_updated_matrices_match_rebuilt_matrices(session, bibset, documents,
+                                                 sparse, regularise):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(
+        bibset, regularise=regularise, sparse=sparse
+    )
+    session.add(term_matrix)
+    session.flush()
+    assert term_matrix.update() is None
+
+    session.add(Document(
+        bibliography_eid=bibset.eid,
+        hash='Inverted indices',
+        title='Inverted indices',
+        description='Searching postings of words',
+        keywords='',
+        language='english',
+    ))
+    documents[0].title = 'Semantic analysis'
+    documents[0].description = 'Searching postings with matrices'
+    session.flush()
+    session.refresh(bibset)
+    updated = term_matrix.update()
+    rebuilt = TermDocumentMatrix.from_bibliography_set(
+        bibset, regularise=regularise, sparse=sparse
+    )
+    assert updated.is_sparse == sparse
+    assert updated.words == rebuilt.words
+    assert numpy.array_equal(updated.document_frequency,
+                             rebuilt.document_frequency)
+    rows = [updated.document_eids.index(eid) for eid in rebuilt.document_eids]
+    matrix = updated.matrix[rows]
+    if sparse:
+        matrix = matrix.toarray()
+    expected = rebuilt.matrix.toarray() if sparse else rebuilt.matrix
+    assert numpy.allclose(matrix, expected)
+
+
+def test_matrices_without_a_document_list_are_not_updated(session, bibset,
+                                                          documents):
+    term_matrix = TermDocumentMatrix.from_bibliography_set(bibset)
+    session.add(term_matrix)
+    session.flush()
+    os.remove(term_matrix._document_list_path(term_matrix.matrix_path))
+    with pytest.raises(ValueError):
+        term_matrix.update()
+
+
+def test_bibliographies_are_extended_with_new_files(session):
+    with open('data/bib/oaa.bib') as first:
+        bibliography = Bibliography.ingest(session, 'bib', [first])
+    with open('data/bib/oaa.bib') as second:
+        assert bibliography.extend(session, 'bib', [second]) == 0
+    assert len(bibliography.documents) == 3
+
+
+def test_queries_use_the_normalizer_of_the_matrix(session, bibset, documents):
+    ranking = RankingMatrix.bm25_from_bibliography(bibset,
+                                                   normalizer_class=Lowercaser)
+    session.add(ranking)
+    session.flush()
+    assert ranking.term_document_matrix.normalizer_class is Lowercaser
+    results = ranking.query(['Matrices'], limit=1)
+    assert [d.title for d, _ in results] == ['Sparse matrices']
@@ -6,6 +6,9 @@ from condor.normalize import StopwordRemover
 from condor.normalize import Lowercaser
 from condor.normalize import LatexAccentRemover
 from condor.normalize import CompleteNormalizer
+from condor.normalize import get_normalizer
+from condor.normalize import stem_cache_info
+from condor.normalize import stem_function
 
 
 @pytest.fixture(scope="module")
@@ -114,3 +117,31 @@ def test_latex_accent_remover_works_with_some_cases(latex):
 
 def test_complete_normalizer_works_with_some_cases(complete):
     assert 'didact' == complete.apply_to(r"did{\'{a}}ctica")
+
+
+def test_stemmers_of_a_language_share_their_cache():
+    first, second = Stemmer(language='english'), Stemmer(language='english')
+    assert first.stem is second.stem
+    first.apply_to('caching cached')
+    hits = stem_cache_info()['english'].hits
+    second.apply_to('caching cached')
+    assert stem_cache_info()['english'].hits == hits + 2
+
+
+def test_latex_accent_remover_prefers_the_longest_format(latex):
+    assert 'Ébáñ' == latex.apply_to(r"\'{E}b{\'a}\~{n}")
+    assert '{á' == latex.apply_to(r"{\'{a}")
+
+
+def test_normalizers_are_shared_by_class_and_language():
+    normalizer = get_normalizer(CompleteNormalizer, 'English')
+    assert normalizer is get_normalizer(CompleteNormalizer, 'english')
+    assert normalizer is not get_normalizer(Stemmer, 'english')
+    assert normalizer is not get_normalizer(CompleteNormalizer, 'spanish')
+    assert get_normalizer().language == CompleteNormalizer.default_language
+
+
+def test_stemmers_keep_their_snowball_stemmer():
+    stemmer = Stemmer(language='english')
+    assert stemmer.stemmer.stem('searching') == 'search'
+    assert stemmer.stemmer.stem is stem_function('english')
@@ -1,8 +1,15 @@
+import io
 import os
 import pytest
 
+from xml.dom import minidom
+
+import bibtexparser
+
 from condor.record import record_iterator_class
 from condor.record import BibtexRecordParser
+from condor.record.froac import iter_element_spans
+from condor.util import isi_text_to_dic
 from condor.record import FroacRecordIterator
 from condor.record import FroacRecordParser
 from condor.record import IsiRecordIterator
@@ -272,6 +279,30 @@ def test_isi_record_iterator_yields_correct_elements():
     assert 'Study of extrusion behaviour and porridge' in record['title']
 
 
+def test_isi_record_iterator_reads_binary_files_like_text_files():
+    filename = os.path.join('data', 'isi', 'isi.txt')
+    with open(filename) as text, open(filename, 'rb') as binary:
+        expected = [
+            IsiRecordParser().parse(record)
+            for record in IsiRecordIterator(text).get_buffer()
+        ]
+        assert list(IsiRecordIterator(binary, encoding='utf-8')) == expected
+
+
+def test_isi_record_iterator_fields_match_the_text_parser():
+    filename = os.path.join('data', 'isi', 'isi.txt')
+    with open(filename) as file:
+        text = file.read()
+    first = text[:text.index('\nER') + 4]
+    record = next(IsiRecordIterator(io.StringIO(text),
+                                    only_mapped=False).get_buffer())
+    expected = isi_text_to_dic(first)
+    expected.pop('', None)
+    assert record == expected
+    mapped = next(IsiRecordIterator(io.StringIO(text)).get_buffer())
+    assert set(mapped) == {'TI', 'AB', 'ID', 'LA', 'UT'}
+
+
 def test_bibtex_record_is_instantiable():
     parser = BibtexRecordParser()
     assert parser is not None
@@ -321,3 +352,59 @@ def test_record_class_yields_the_rirgt_record():
     assert record_iterator_class('xml') == FroacRecordIterator
     with pytest.raises(ValueError):
         _ = record_iterator_class('not legit')
+
+
+@pytest.mark.parametrize('chunk_size', [7, 2 ** 16])
+def test_froac_spans_match_the_whole_document(chunk_size):
+    filename = os.path.join('data', 'froac', 'roapManizales5.xml')
+    parser = FroacRecordParser()
+    document = minidom.parse(filename)
+    records = [
+        parser.parse(element)
+        for element in document.getElementsByTagName('record')
+    ]
+    with open(filename, 'rb') as file:
+        spans = list(iter_element_spans(file, 'record', chunk_size))
+    assert len(spans) == len(records)
+    expected = [
+        record['hash'] for record in records
+        if any(record[field] for field in ('title', 'description', 'keywords'))
+    ]
+    assert [record['hash'] for record in FroacRecordIterator(filename)] == \
+        expected
+
+
+def test_froac_spans_keep_empty_and_nested_elements():
+    content = io.BytesIO(
+        b'<a xmlns:x="u"><record/><record><record x:y="1"/></record></a>'
+    )
+    spans = list(iter_element_spans(content, 'record', chunk_size=3))
+    assert [span for span, _, _ in spans] == [
+        b'<record/>', b'<record><record x:y="1"/></record>',
+    ]
+    assert all(namespaces == {'xmlns:x': 'u'} for _, namespaces, _ in spans)
+
+
+@pytest.mark.parametrize('chunk_size', [3, 1024])
+def test_froac_spans_stop_at_their_own_end_tag(chunk_size):
+    content = io.BytesIO(
+        b'<records><record></record ><record/></records>'
+    )
+    spans = list(iter_element_spans(content, 'record', chunk_size))
+    assert [span for span, _, _ in spans] == [
+        b'<record></record >', b'<record/>',
+    ]
+    content = io.BytesIO(b'<records><record/></records>')
+    assert len(list(FroacRecordIterator(content).get_buffer())) == 1
+
+
+@pytest.mark.parametrize('batch_size,jobs', [(1, 1), (2, 2), (256, 1)])
+def test_bibtex_batches_match_the_whole_file(batch_size, jobs):
+    with open(os.path.join('data', 'bib', 'oaa.bib')) as file:
+        text = file.read()
+    text += '@string{venue = "Condor"}\n@article{macro,\n title = venue,\n}\n'
+    expected = bibtexparser.loads(text).entries
+    iterator = BibtexRecordIterator(io.StringIO(text), jobs=jobs)
+    iterator.batch_size = batch_size
+    assert list(iterator.get_buffer()) == expected
+    assert expected[-1]['title'] == 'Condor'
@@ -76,3 +76,34 @@ def test_condor_ranking_group(runner):
     res = runner.invoke(ranking, [])
     assert res.exit_code == 0
     assert 'Usage' in res.output
+
+
+def test_query_requires_parameters_or_a_batch(runner):
+    res = runner.invoke(query, ['--batch-size', '10'])
+    assert res.exit_code == 2
+    assert 'batch file' in res.output
+
+
+def test_condor_matrix_update_adds_new_documents(runner):
+    res = runner.invoke(bibcreate, ['bib', 'data/bib/oaa.bib'])
+    eid = res.output.split('writing to ')[1].split()[0]
+    res = runner.invoke(matrix, ['create', '--target', eid])
+    assert res.exit_code == 0
+    res = runner.invoke(matrix, ['update'])
+    assert 'There are no new or changed documents' in res.output
+    res = runner.invoke(bibliography, ['add', eid, 'isi', 'data/isi/isi.txt'])
+    assert res.exit_code == 0
+    res = runner.invoke(matrix, ['update'])
+    assert res.exit_code == 0
+    assert 'Done!' in res.output
+
+
+def test_query_rejects_unsupported_languages(runner):
+    res = runner.invoke(query, ['--language', 'klingon', 'search'])
+    assert res.exit_code == 2
+    assert 'can not normalize klingon text' in res.output
+
+
+def test_query_batch_size_must_be_positive(runner):
+    res = runner.invoke(query, ['--batch', '-', '--batch-size', '0'])
+    assert res.exit_code == 2
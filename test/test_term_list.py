@@ -0,0 +1,48 @@
+import pytest
+
+from condor.term_list import TermList
+
+
+@pytest.fixture
+def terms(tmpdir):
+    words = sorted(['matric', 'search', 'didáct', 'ñandú', 'a', 'zeta'])
+    path = str(tmpdir.join('words.terms'))
+    TermList.write(path, words)
+    return words, TermList(path)
+
+
+def test_term_lists_keep_the_words_in_order(terms):
+    words, term_list = terms
+    assert len(term_list) == len(words)
+    assert list(term_list) == words
+    assert term_list[-1] == words[-1]
+    with pytest.raises(IndexError):
+        term_list[len(words)]
+
+
+def test_term_lists_find_the_position_of_every_word(terms):
+    words, term_list = terms
+    for position, word in enumerate(words):
+        assert term_list.get(word) == position
+    assert 'unknown' not in term_list
+    assert term_list.get('') is None
+    assert term_list.get('zzz', -1) == -1
+
+
+def test_term_lists_need_sorted_words(tmpdir):
+    with pytest.raises(ValueError):
+        TermList.write(str(tmpdir.join('words.terms')), ['b', 'a'])
+
+
+def test_empty_term_lists(tmpdir):
+    path = str(tmpdir.join('words.terms'))
+    TermList.write(path, [])
+    assert list(TermList(path)) == []
+    assert TermList(path).get('a') is None
+
+
+def test_term_lists_are_closed_on_exit(terms):
+    words, term_list = terms
+    with TermList(term_list.path) as other:
+        assert list(other) == words
+    assert other._buffer.closed
@@ -1,6 +1,6 @@
 import pytest
 
-from condor.util import isi_text_to_dic
+from condor.util import encode_query, isi_text_to_dic
 
 
 @pytest.fixture(scope='module')
@@ -119,3 +119,13 @@ def test_isi_record_to_dic(isi_text):
     dic = isi_text_to_dic(isi_text)
     assert ['J'] == dic['PT']
     assert 5 == len(dic['AU'])
+
+
+def test_encode_query_keeps_only_known_terms():
+    term_index = {'document': 0, 'search': 1, 'matric': 2}
+    columns, counts = encode_query(
+        term_index, ['Matrices', 'searching', 'the', 'unknown', 'search'],
+        language='english',
+    )
+    assert list(columns) == [1, 2]
+    assert list(counts) == [2, 1]